@@ -9,15 +9,18 @@ dynamodb_client.create_table(
     AttributeDefinitions=[
         {"AttributeName": "link", "AttributeType": "S"},
         {"AttributeName": "published_datetime", "AttributeType": "N"},
-        {"AttributeName": "category", "AttributeType": "S"}
+        {"AttributeName": "category_bucket", "AttributeType": "S"}
     ],
     KeySchema=[
         {"AttributeName": "link", "KeyType": "HASH"}
     ],
     GlobalSecondaryIndexes=[
-        {'IndexName': 'published_datetime',
+        # 日付バケット(+書き込みシャード)で分散させたGSI。APIはこれをバケットごとに並列クエリする
+        # (全件を category 1値に集約していた旧GSI published_datetime はホットパーティションになるため廃止)
+        # キーの形式は app/batch/partition.py を参照 (例: "AI_news#20260405")
+        {'IndexName': 'published_datetime_bucket',
          "KeySchema": [
-                {"AttributeName": "category", "KeyType": "HASH"},         # 全件を集約するパーティション
+                {"AttributeName": "category_bucket", "KeyType": "HASH"},  # カテゴリ + 日付バケット
                 {"AttributeName": "published_datetime", "KeyType": "RANGE"} # 日付でソート
          ],
          'Projection': {'ProjectionType': 'ALL'}
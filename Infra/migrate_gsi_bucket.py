@@ -0,0 +1,112 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+import boto3
+
+# プロジェクトルートをPythonパスに追加 (app.batch.partition のキー設計を共有するため)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.batch import partition
+
+TABLE_NAME = "ai_news"
+# 全アイテムを category="AI_news" の1パーティションに集約していた旧GSI
+LEGACY_INDEX_NAME = "published_datetime"
+
+# 既存テーブルを日付バケットGSIへ移行するスクリプト
+# 1. published_datetime_bucket GSIが無ければ追加し、ACTIVEになるまで待つ
+# 2. category_bucket を持たない既存アイテムへ、バッチと同じ規則でバケットキーを付与する
+# 3. (--drop-legacy 指定時のみ) 再度バックフィルしてから、書き込みのホットパーティションとなる旧GSI published_datetime を削除する
+# 手順:
+#   a. バッチ・APIのデプロイ前に引数なしで実行する(新GSIの追加とバックフィル。旧GSIは旧APIのために残す)
+#   b. 新しいバッチ・APIのデプロイ完了後に --drop-legacy を付けて実行する
+#      デプロイまでの間に旧バッチが書き込んだアイテムにもバケットキーを付与してから旧GSIを削除する
+
+def index_statuses(dynamodb_client, table_name):
+    table = dynamodb_client.describe_table(TableName=table_name)["Table"]
+    return {index["IndexName"]: index["IndexStatus"] for index in table.get("GlobalSecondaryIndexes", [])}
+
+def add_bucket_index(dynamodb_client, table_name):
+    if partition.BUCKET_INDEX_NAME in index_statuses(dynamodb_client, table_name):
+        print(f"GSI {partition.BUCKET_INDEX_NAME} は既に存在します。")
+        return
+
+    print(f"GSI {partition.BUCKET_INDEX_NAME} を作成します...")
+    dynamodb_client.update_table(
+        TableName=table_name,
+        AttributeDefinitions=[
+            {"AttributeName": partition.BUCKET_ATTRIBUTE, "AttributeType": "S"},
+            {"AttributeName": "published_datetime", "AttributeType": "N"}
+        ],
+        GlobalSecondaryIndexUpdates=[
+            {"Create": {
+                "IndexName": partition.BUCKET_INDEX_NAME,
+                "KeySchema": [
+                    {"AttributeName": partition.BUCKET_ATTRIBUTE, "KeyType": "HASH"},
+                    {"AttributeName": "published_datetime", "KeyType": "RANGE"}
+                ],
+                "Projection": {"ProjectionType": "ALL"}
+            }}
+        ]
+    )
+    while True:
+        status = index_statuses(dynamodb_client, table_name).get(partition.BUCKET_INDEX_NAME)
+        if status == "ACTIVE":
+            break
+        print(f"GSIの作成待ち... ({status})")
+        time.sleep(10)
+
+def backfill_bucket_keys(table):
+    kwargs = {"ProjectionExpression": "link, published_datetime, category, #b",
+              "ExpressionAttributeNames": {"#b": partition.BUCKET_ATTRIBUTE}}
+    updated = 0
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get("Items", []):
+            if "published_datetime" not in item or partition.BUCKET_ATTRIBUTE in item:
+                continue
+            key = partition.bucket_key(item.get("category", "AI_news"), item["published_datetime"], item["link"])
+            table.update_item(
+                Key={"link": item["link"]},
+                UpdateExpression="SET #b = :b",
+                ExpressionAttributeNames={"#b": partition.BUCKET_ATTRIBUTE},
+                ExpressionAttributeValues={":b": key}
+            )
+            updated += 1
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        kwargs["ExclusiveStartKey"] = last_key
+    print(f"{updated} 件のアイテムにバケットキーを付与しました。")
+    return updated
+
+def drop_legacy_index(dynamodb_client, table_name):
+    # DynamoDBは1回のupdate_tableで1つのGSIしか作成・削除できないため、新GSIがACTIVEになってから実行する
+    if LEGACY_INDEX_NAME not in index_statuses(dynamodb_client, table_name):
+        print(f"旧GSI {LEGACY_INDEX_NAME} は既に削除されています。")
+        return
+    print(f"旧GSI {LEGACY_INDEX_NAME} を削除します...")
+    dynamodb_client.update_table(
+        TableName=table_name,
+        GlobalSecondaryIndexUpdates=[{"Delete": {"IndexName": LEGACY_INDEX_NAME}}]
+    )
+    while LEGACY_INDEX_NAME in index_statuses(dynamodb_client, table_name):
+        print("旧GSIの削除待ち...")
+        time.sleep(10)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="日付バケットGSIへの移行")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="新しいバッチ・APIのデプロイ後に、再バックフィルしてから旧GSIを削除する")
+    args = parser.parse_args(argv)
+
+    dynamodb_client = boto3.client("dynamodb")
+    add_bucket_index(dynamodb_client, TABLE_NAME)
+    table = boto3.resource("dynamodb").Table(TABLE_NAME)
+    backfill_bucket_keys(table)
+    if args.drop_legacy:
+        drop_legacy_index(dynamodb_client, TABLE_NAME)
+    else:
+        print(f"旧GSI {LEGACY_INDEX_NAME} は残しています。新しいバッチ・APIのデプロイ後に --drop-legacy を付けて再実行してください。")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
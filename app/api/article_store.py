@@ -0,0 +1,114 @@
+import bisect
+import threading
+import time
+import logging
+from app.api import get_dynamod_data
+
+logger = logging.getLogger(__name__)
+
+# 保持する期間。DynamoDBのTTL(14日)と揃える
+STORE_RETENTION_DAYS = 14
+# この秒数が経過するまでは再クエリせずメモリ上のデータで応答する(バッチは1日1回)
+STORE_REFRESH_SECONDS = 300
+# 差分取得時に最新の公開日時からさかのぼる秒数。
+# バッチは公開から遅れて記事を取り込むことがあるため、最新時刻より少し前から取り直してリンクで重複排除する
+STORE_REFRESH_OVERLAP_SECONDS = 2*24*60*60
+
+
+class _TableArticles:
+    def __init__(self):
+        self.times = []   # published_datetimeの昇順
+        self.items = []   # timesと同じ順序の記事
+        self.links = set()
+        self.refreshed_at = 0.0
+
+    def add(self, item):
+        link = item.get('link')
+        if link is not None and link in self.links:
+            return False
+        published = int(item.get('published_datetime', 0))
+        index = bisect.bisect_right(self.times, published)
+        self.times.insert(index, published)
+        self.items.insert(index, item)
+        if link is not None:
+            self.links.add(link)
+        return True
+
+    def evict_before(self, cutoff):
+        index = bisect.bisect_left(self.times, cutoff)
+        if index == 0:
+            return
+        for item in self.items[:index]:
+            self.links.discard(item.get('link'))
+        del self.times[:index]
+        del self.items[:index]
+
+
+class ArticleStore:
+    """DynamoDBの記事を公開日時順に保持し、任意のN日間の窓をbisectで切り出すリードスルーキャッシュ"""
+
+    def __init__(self, retention_days=STORE_RETENTION_DAYS, refresh_seconds=STORE_REFRESH_SECONDS,
+                 overlap_seconds=STORE_REFRESH_OVERLAP_SECONDS):
+        self.retention_days = retention_days
+        self.refresh_seconds = refresh_seconds
+        self.overlap_seconds = overlap_seconds
+        self._tables = {}
+        self._refreshing = set()  # DynamoDBへ再取得中のテーブル名
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def warm(self, table_name='ai_news'):
+        logger.info(f"[Store] 記事キャッシュを初期化します: {table_name}")
+        self.refresh(table_name, force=True)
+
+    def refresh(self, table_name='ai_news', force=False):
+        with self._condition:
+            while True:
+                articles = self._tables.get(table_name)
+                now = time.time()
+                if articles is not None and not force and now - articles.refreshed_at < self.refresh_seconds:
+                    return
+                if table_name not in self._refreshing:
+                    break
+                if articles is not None:
+                    # 他のスレッドが再取得中のため、クエリせずキャッシュから応答する
+                    return
+                # 初回取得中はキャッシュが無いため、完了を待つ
+                self._condition.wait()
+            self._refreshing.add(table_name)
+            # 2回目以降は最新の公開日時付近から先だけを取得する(初回は保持期間全体)
+            start_time = articles.times[-1] - self.overlap_seconds if articles is not None and articles.times else None
+
+        # DynamoDBへのクエリ中も他のリクエストがキャッシュから応答できるよう、ロックの外で取得する
+        try:
+            items = get_dynamod_data.get_dynamo_data(days=self.retention_days, table_name=table_name,
+                                                     start_time=start_time)
+        except Exception as e:
+            if articles is None:
+                raise
+            # refreshed_atは更新せず、次のリクエストで再取得する
+            logger.warning(f"[Store] 記事の再取得に失敗したため、キャッシュから応答します: {e}")
+            return
+        else:
+            with self._lock:
+                new_articles = self._tables.setdefault(table_name, _TableArticles())
+                added = sum(1 for item in items if new_articles.add(item))
+                new_articles.evict_before(int(now - self.retention_days*24*60*60))
+                new_articles.refreshed_at = now
+                logger.info(f"[Store] {added} 件を追加しました (保持件数: {len(new_articles.items)})")
+        finally:
+            with self._condition:
+                self._refreshing.discard(table_name)
+                self._condition.notify_all()
+
+    def get_articles(self, days=7, table_name='ai_news'):
+        # 保持期間(=TTL)を超える窓は /predict・/jobs のパラメータ検証で弾かれる
+        self.refresh(table_name)
+        with self._lock:
+            articles = self._tables[table_name]
+            start = bisect.bisect_left(articles.times, int(time.time() - int(days)*24*60*60))
+            return articles.items[start:]
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
@@ -0,0 +1,154 @@
+import os
+import json
+import random
+import threading
+import time
+import logging
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+logger = logging.getLogger(__name__)
+
+# Bedrock呼び出しの共通窓口
+# - AIMD方式の同時実行数制御(成功で少しずつ増やし、スロットリングで半減)
+# - スロットリング・一時的なエラー(接続エラー、読み取りタイムアウト、5xx)時のジッター付き指数バックオフ
+#   (クライアント側の再試行は無効にしているため、再試行はすべてここで行う)
+# - 1分あたりのトークン予算
+# 記事ごとのカテゴリ・優先度の判定は1回の呼び出しでまとめて行うため、モデルは1つ(再判定も同じモデルを使う)
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-5-sonnet-20240620-v1:0")
+# Bedrockのプロンプトキャッシュに対応しているモデル(モデルIDの一部。推論プロファイルの "us." 等の接頭辞は問わない)
+# 既定の Claude 3.5 Sonnet (20240620) は非対応
+PROMPT_CACHING_MODELS = ("anthropic.claude-3-5-haiku", "anthropic.claude-3-7-sonnet", "anthropic.claude-sonnet-4",
+                         "anthropic.claude-opus-4", "anthropic.claude-haiku-4")
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException",
+                          "ServiceUnavailableException", "ModelNotReadyException"}
+# スロットリングではないが再試行すれば成功しうるエラー(同時実行上限は下げない)
+TRANSIENT_ERROR_CODES = {"InternalServerException", "ModelTimeoutException"}
+BEDROCK_TOKENS_PER_MINUTE = int(os.getenv("BEDROCK_TOKENS_PER_MINUTE", "200000"))
+BEDROCK_INITIAL_CONCURRENCY = 4
+BEDROCK_MAX_CONCURRENCY = 16
+BEDROCK_MAX_RETRIES = 6
+
+
+def supports_prompt_caching(model_id):
+    return any(name in (model_id or "") for name in PROMPT_CACHING_MODELS)
+
+def is_throttling(error):
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+def is_transient(error):
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES
+
+def estimate_tokens(body):
+    # 入力は文字数からの概算(日本語混在のため1トークン≒3文字とみなす)、出力はmax_tokensを上限として見積もる
+    # プロンプトキャッシュ利用時は指示の大半がsystemに移るため、system・toolsも入力に含める
+    payload = json.loads(body) if isinstance(body, (str, bytes)) else body
+    prompt = [payload.get(key) for key in ("system", "messages", "tools") if payload.get(key)]
+    return len(json.dumps(prompt, ensure_ascii=False)) // 3 + payload.get("max_tokens", 0)
+
+
+class AIMDLimiter:
+    """同時実行数の上限を、成功時は加算的に増やし、スロットリング時は乗算的に減らす"""
+
+    def __init__(self, initial=BEDROCK_INITIAL_CONCURRENCY, minimum=1, maximum=BEDROCK_MAX_CONCURRENCY,
+                 decrease_factor=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False, succeeded=True):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            elif succeeded:
+                # 上限1回分の成功でおよそ+1になるように増やす
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class TokenBudget:
+    """1分あたりのトークン数を上限とするトークンバケット"""
+
+    def __init__(self, tokens_per_minute=BEDROCK_TOKENS_PER_MINUTE, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = float(tokens_per_minute)
+        self.available = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens):
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                wait = (tokens - self.available) / self.rate
+            logger.info(f"    [Gateway] トークン予算の回復待ち ({wait:.1f} 秒)")
+            self.sleep(wait)
+
+
+class UnlimitedBudget:
+    """トークン予算を設けない(実際のBedrockを呼ばないオフライン評価の偽・記録済みバックエンド用)"""
+
+    def consume(self, tokens):
+        return
+
+
+class BedrockGateway:
+    def __init__(self, limiter=None, budget=None, max_retries=BEDROCK_MAX_RETRIES, base_delay=0.5,
+                 max_delay=20.0, sleep=time.sleep, model_id=BEDROCK_MODEL_ID):
+        self.limiter = AIMDLimiter() if limiter is None else limiter
+        self.budget = TokenBudget(sleep=sleep) if budget is None else budget
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.model_id = model_id
+
+    def backoff(self, attempt):
+        # フルジッター: 0〜min(max_delay, base*2^attempt) の一様乱数
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def invoke(self, client, body, model_id=None):
+        model_id = model_id or self.model_id
+        self.budget.consume(estimate_tokens(body))
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            throttled = False
+            succeeded = False
+            try:
+                response = client.invoke_model(modelId=model_id, body=body)
+                succeeded = True
+                return response
+            except (ClientError, ConnectionError, HTTPClientError) as e:
+                throttled = is_throttling(e)
+                if not (throttled or is_transient(e)) or attempt == self.max_retries:
+                    raise
+                reason = "スロットリングされました" if throttled else f"一時的なエラーが発生しました ({type(e).__name__})"
+            finally:
+                self.limiter.release(throttled=throttled, succeeded=succeeded)
+            delay = self.backoff(attempt)
+            logger.warning(f"    [Gateway] {model_id} で{reason}。{delay:.2f} 秒後に再試行します "
+                           f"({attempt + 1}/{self.max_retries}, 同時実行上限: {self.limiter.limit:.1f})")
+            self.sleep(delay)
+
+
+# プロセス全体で同時実行数とトークン予算を共有する
+default_gateway = BedrockGateway()
@@ -0,0 +1,185 @@
+import os
+import json
+import hashlib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import requests
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# 優先度の高い記事の本文を取得する(readme「3. スクレイピング & 要約」)
+FULLTEXT_CACHE_DIR = os.getenv("FULLTEXT_CACHE_DIR", "/tmp/ai_news_fulltext")
+FULLTEXT_MAX_WORKERS = 8
+FULLTEXT_PER_HOST = 2           # 同一ホストへの同時接続数
+FULLTEXT_HOST_INTERVAL = 1.0    # 同一ホストへのリクエスト間隔(秒)
+FULLTEXT_TIMEOUT = 10
+FULLTEXT_MAX_CHARS = 4000       # 保存・LLMへ渡す本文の最大文字数
+USER_AGENT = "AI_news_deliver/1.0 (+https://github.com/badorisu0555/AI_news_deliver)"
+
+
+def extract_main_text(html, max_chars=FULLTEXT_MAX_CHARS, from_encoding=None):
+    # script/ナビゲーション等を除き、<article> → <main> → <body> の順に本文らしい要素からテキストを取り出す
+    # html がバイト列の場合、from_encoding が無ければ文字コードは<meta charset>や内容から判定される
+    soup = BeautifulSoup(html, 'html.parser', from_encoding=from_encoding)
+    for tag in soup(["script", "style", "noscript", "nav", "header", "footer", "aside", "form"]):
+        tag.decompose()
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    lines = [line.strip() for line in root.get_text(separator="\n").splitlines()]
+    text = "\n".join(line for line in lines if line)
+    return text[:max_chars]
+
+
+class ContentCache:
+    """URL→本文ハッシュの索引と、本文ハッシュをファイル名にした本文(コンテンツアドレス)をディスクに保持する"""
+
+    def __init__(self, cache_dir=FULLTEXT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _index_path(self, url):
+        return os.path.join(self.cache_dir, "urls", hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, "blobs", content_hash[:2], content_hash + ".txt")
+
+    def get(self, url):
+        try:
+            with open(self._index_path(url), encoding="utf-8") as f:
+                content_hash = json.load(f)["content_hash"]
+            with open(self._blob_path(content_hash), encoding="utf-8") as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, url, text):
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        index_path = self._index_path(url)
+        with self._lock:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            if not os.path.exists(blob_path):
+                self._atomic_write(blob_path, text)
+            self._atomic_write(index_path, json.dumps({"url": url, "content_hash": content_hash}))
+        return content_hash
+
+    def _atomic_write(self, path, text):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+class HostLimiter:
+    """ホストごとの同時接続数とリクエスト間隔を制限する"""
+
+    def __init__(self, per_host=FULLTEXT_PER_HOST, min_interval=FULLTEXT_HOST_INTERVAL):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self._semaphores = {}
+        self._last_request = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, host):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with semaphore:
+            with self._lock:
+                wait = self._last_request.get(host, 0) + self.min_interval - time.time()
+                self._last_request[host] = time.time() + max(wait, 0)
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+
+class FullTextFetcher:
+    """リンクの本文を並列に取得する。robots.txtに従い、取得済みのURLはキャッシュから返す"""
+
+    def __init__(self, cache=None, max_workers=FULLTEXT_MAX_WORKERS, per_host=FULLTEXT_PER_HOST,
+                 host_interval=FULLTEXT_HOST_INTERVAL, timeout=FULLTEXT_TIMEOUT, user_agent=USER_AGENT):
+        self.cache = ContentCache() if cache is None else cache
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.limiter = HostLimiter(per_host, host_interval)
+        self._robots = {}
+        self._robots_origin_locks = {}
+        self._robots_lock = threading.Lock()
+
+    def _get(self, url):
+        return requests.get(url, timeout=self.timeout, headers={"User-Agent": self.user_agent})
+
+    def _robots_for(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._robots_lock:
+            if origin in self._robots:
+                return self._robots[origin]
+            origin_lock = self._robots_origin_locks.setdefault(origin, threading.Lock())
+        # 同じオリジンの記事を並列に取得しても、robots.txtはオリジンごとに1回だけ取得する
+        with origin_lock:
+            with self._robots_lock:
+                if origin in self._robots:
+                    return self._robots[origin]
+            parser = RobotFileParser()
+            try:
+                with self.limiter.slot(parts.netloc):
+                    response = self._get(f"{origin}/robots.txt")
+                if response.status_code >= 500:
+                    parser.disallow_all = True
+                elif response.status_code >= 400:
+                    parser.allow_all = True
+                else:
+                    parser.parse(response.text.splitlines())
+            except requests.RequestException:
+                parser.disallow_all = True
+            with self._robots_lock:
+                self._robots[origin] = parser
+        return parser
+
+    def fetch(self, url):
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        if not self._robots_for(url).can_fetch(self.user_agent, url):
+            logger.info(f"[FullText] robots.txtにより取得をスキップします: {url}")
+            return None
+        try:
+            with self.limiter.slot(urlsplit(url).netloc):
+                response = self._get(url)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"[FullText] 本文の取得に失敗しました: {url} {e}")
+            return None
+        # Content-Typeにcharsetが無いとrequestsはtext/htmlをISO-8859-1として扱い、日本語が文字化けするため、
+        # ヘッダーで指定された場合のみその文字コードを使い、それ以外はバイト列からBeautifulSoupに判定させる
+        has_charset = "charset" in response.headers.get("Content-Type", "").lower()
+        text = extract_main_text(response.content, from_encoding=response.encoding if has_charset else None)
+        self.cache.put(url, text)
+        return text
+
+    def fetch_all(self, urls):
+        # 重複を除いて並列に取得し、{url: 本文 or None} を返す
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(urls), self.max_workers)) as executor:
+            return dict(zip(urls, executor.map(self.fetch, urls)))
+
+
+def attach_full_text(summary_items, fetcher, priorities=("High",)):
+    # LLMの判定結果のうち、指定した優先度の記事に本文を付与する
+    targets = [item for item in summary_items
+               if isinstance(item, dict) and item.get("priority") in priorities and item.get("link")]
+    texts = fetcher.fetch_all(item["link"] for item in targets)
+    for item in targets:
+        if texts.get(item["link"]):
+            item["full_text"] = texts[item["link"]]
+    return summary_items
@@ -1,28 +1,70 @@
-import pandas as pd
+import heapq
 import boto3
 import time
-from boto3.dynamodb.conditions import Key, Attr
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from app.batch import partition
 
+MAX_QUERY_WORKERS = 8
+REGION_NAME = 'ap-northeast-1'
+# 記事のTTL(14日)。これより古いバケットには記事が残っていないため、取得期間をこの範囲に収める
+ITEM_TTL_DAYS = 14
 
-# 一括書き込み。batch_writerを使用すると、DynamoDBの制限に基づいて自動的にバッチを分割してくれる。
-def get_dynamo_data(days=7, table_name='ai_news'):
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+# 低レベルのclientはスレッドセーフなので、1回の取得につき1つ作って全ワーカーで共有する
+def new_client():
+    return boto3.client('dynamodb', region_name=REGION_NAME)
+
+
+# 1バケット分のクエリ。1MBを超える場合はLastEvaluatedKeyでページングする
+def query_bucket(client, table_name, bucket_key, start_time, end_time):
+    items = []
+    kwargs = {
+        "TableName": table_name,
+        "IndexName": partition.BUCKET_INDEX_NAME,
+        "KeyConditionExpression": "#bucket = :bucket AND published_datetime BETWEEN :start AND :end",
+        "ExpressionAttributeNames": {"#bucket": partition.BUCKET_ATTRIBUTE},
+        "ExpressionAttributeValues": {
+            ":bucket": _serializer.serialize(bucket_key),
+            ":start": _serializer.serialize(start_time),
+            ":end": _serializer.serialize(end_time),
+        },
+    }
+    while True:
+        response = client.query(**kwargs)
+        items.extend({key: _deserializer.deserialize(value) for key, value in item.items()}
+                     for item in response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return items
+        kwargs["ExclusiveStartKey"] = last_key
+
+# 期間にかかる全バケットへ並列にクエリし、公開日時順にマージする
+# start_timeを指定した場合は、days ではなく start_time 以降の記事を取得する(差分取得用)
+def get_dynamo_data(days=7, table_name='ai_news', category='AI_news', start_time=None):
     ut = time.time()
-    START_TIME = int(ut - days*24*60*60) # 7日間の範囲指定
+    START_TIME = int(ut - int(days)*24*60*60) if start_time is None else int(start_time) # 7日間の範囲指定
+    START_TIME = max(START_TIME, int(ut - ITEM_TTL_DAYS*24*60*60)) # TTLより前の記事は存在しない
     END_TIME = int(ut) #現在の時間
 
-    client = boto3.client('dynamodb', region_name='ap-northeast-1')
-    dynamodb = boto3.resource('dynamodb', region_name='ap-northeast-1')
-    table = dynamodb.Table(table_name)
-
-    response = table.query(
-        IndexName = "published_datetime",
-        KeyConditionExpression=(
-            Key("category").eq("AI_news") &
-            Key("published_datetime").between(START_TIME, END_TIME)
-        )
-    )
+    bucket_keys = partition.bucket_keys(category, START_TIME, END_TIME)
+    client = new_client()
+    with ThreadPoolExecutor(max_workers=min(len(bucket_keys), MAX_QUERY_WORKERS)) as executor:
+        results = list(executor.map(lambda key: query_bucket(client, table_name, key, START_TIME, END_TIME),
+                                    bucket_keys))
 
-    items = response.get('Items', [])
+    # 各バケットの結果はpublished_datetimeの昇順なので、heapq.mergeで順序を保ったまま結合する
+    items = []
+    seen = set()
+    for item in heapq.merge(*results, key=lambda item: item.get('published_datetime', 0)):
+        item_key = item.get('link', item.get('id'))
+        if item_key is not None and item_key in seen:
+            continue
+        seen.add(item_key)
+        items.append(item)
     return items
 
 # 動作確認
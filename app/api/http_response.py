@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # brotliは任意依存。無ければgzipのみ対応する
+    brotli = None
+
+# この値より小さいレスポンスは圧縮しない(ヘッダ分のオーバーヘッドの方が大きくなるため)
+COMPRESS_MIN_SIZE = 1024
+# パラメータ→ETagの対応を信用する秒数。期間指定の窓はずれていくため、期限切れ後はDynamoDBを再確認する
+ETAG_TTL_SECONDS = 300
+MAX_CACHE_ENTRIES = 64
+ENCODINGS = ("br", "gzip")
+
+
+def compute_etag(news_data, prompt_version):
+    # 記事集合(リンク+公開日時)とプロンプトのバージョンから強いETagを作る。順序には依存しない
+    keys = sorted(f"{item.get('link', '')}|{item.get('published_datetime', '')}" for item in news_data)
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode("utf-8"))
+    for key in keys:
+        digest.update(b"\n")
+        digest.update(key.encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def encoded_etag(etag, encoding):
+    # 強いETagは表現ごとに一意である必要があるため、圧縮形式をサフィックスとして付ける("abc" → "abc-gzip")
+    if not etag or not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _base_etag(tag):
+    # If-None-Matchは弱い比較なので W/ を外し、圧縮形式のサフィックスも外して記事集合のETagと比較する
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def matching_etag(if_none_match, etag):
+    # If-None-Matchのうち etag(圧縮形式の違いは問わない)に一致したタグを返す。一致しなければNone
+    if not if_none_match or not etag:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    for tag in if_none_match.split(","):
+        if _base_etag(tag) == etag:
+            return tag.strip()
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    return matching_etag(if_none_match, etag) is not None
+
+
+class ResponseCache:
+    """パラメータごとの最新ETagと、ETagごとのレスポンスボディを保持する小さなLRUキャッシュ"""
+
+    def __init__(self, ttl=ETAG_TTL_SECONDS, max_entries=MAX_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._etags = OrderedDict()
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_etag(self, key):
+        with self._lock:
+            entry = self._etags.get(key)
+            if entry is None:
+                return None
+            etag, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._etags[key]
+                return None
+            return etag
+
+    def set_etag(self, key, etag):
+        with self._lock:
+            self._etags[key] = (etag, time.time())
+            self._etags.move_to_end(key)
+            while len(self._etags) > self.max_entries:
+                self._etags.popitem(last=False)
+
+    def get_body(self, etag):
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+            return body
+
+    def set_body(self, etag, body):
+        with self._lock:
+            self._bodies[etag] = body
+            self._bodies.move_to_end(etag)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._etags.clear()
+            self._bodies.clear()
+
+
+def choose_encoding(accept_encoding):
+    accepted = [part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")]
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def not_modified_response(etag, if_none_match=None):
+    # クライアントが保持している表現(圧縮形式込み)のETagをそのまま返す
+    return Response(status_code=304,
+                    headers={"ETag": matching_etag(if_none_match, etag) or etag, "Vary": "Accept-Encoding"})
+
+
+def json_response(content, etag=None, accept_encoding=None):
+    # JSONを一度だけエンコードし、閾値以上ならクライアントが受け付ける形式で圧縮して返す
+    body = content if isinstance(content, bytes) else json.dumps(content, ensure_ascii=False).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        body = compress_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+    if etag:
+        headers["ETag"] = encoded_etag(etag, encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
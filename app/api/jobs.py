@@ -0,0 +1,94 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_WORKERS = 4
+# 完了したジョブの結果を保持する秒数
+JOB_RESULT_TTL_SECONDS = 600
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobManager:
+    """要約ジョブを上限付きのワーカープールで実行し、状態と結果をTTL付きで保持する"""
+
+    def __init__(self, max_workers=JOB_MAX_WORKERS, result_ttl=JOB_RESULT_TTL_SECONDS):
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary-job")
+        self._jobs = {}
+        self._job_ids_by_key = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, *args, **kwargs):
+        # 同じパラメータのジョブが実行中または結果保持中であれば、そのジョブを返す(重複排除)
+        with self._lock:
+            self._purge_expired()
+            job_id = self._job_ids_by_key.get(key)
+            if job_id is not None and self._jobs[job_id]["status"] != FAILED:
+                return dict(self._jobs[job_id])
+
+            job_id = uuid.uuid4().hex
+            job = {"job_id": job_id, "status": QUEUED, "submitted_at": time.time()}
+            self._jobs[job_id] = job
+            self._job_ids_by_key[key] = job_id
+            self._futures[job_id] = self._executor.submit(self._run, job_id, func, args, kwargs)
+            logger.info(f"[Job] ジョブを登録しました: {job_id} {key}")
+            return dict(job)
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"[Job] ジョブが失敗しました: {job_id} {e}")
+            logger.debug(traceback.format_exc())
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            return
+        self._update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+        logger.info(f"[Job] ジョブが完了しました: {job_id}")
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.get("finished_at") is not None and now - job["finished_at"] > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._futures.pop(job_id, None)
+        for key, job_id in list(self._job_ids_by_key.items()):
+            if job_id not in self._jobs:
+                del self._job_ids_by_key[key]
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id, timeout=None):
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.get(job_id)
+
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
+            self._job_ids_by_key.clear()
+            self._futures.clear()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
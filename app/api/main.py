@@ -1,36 +1,146 @@
-from app.api import get_dynamod_data
 from app.api import news_summary
-from fastapi import FastAPI, Query
+from app.api import http_response
+from app.api import jobs
+from app.api import article_store
+from app.api import fulltext
+from app.api import summary_schema
+from app.batch import embedding
+from fastapi import FastAPI, Query, Request
 from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+import os
+import json
 import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
 
-app = FastAPI()
+# 直近の記事をメモリに保持し、/predict ごとのDynamoDBクエリを避ける
+news_store = article_store.ArticleStore()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # 起動時にキャッシュを温めておく。失敗しても初回リクエスト時に再取得するので起動は続ける
+    try:
+        news_store.warm(table_name='ai_news')
+    except Exception as e:
+        logging.warning(f"記事キャッシュの初期化に失敗しました: {e}")
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+# /predict のETagとレスポンスボディのキャッシュ
+response_cache = http_response.ResponseCache()
+# /jobs の非同期要約ジョブ。ワーカー数を絞り、Bedrockへの同時リクエストが増えすぎないようにする
+job_manager = jobs.JobManager()
+# FULLTEXT_ENABLED=1 の場合、優先度Highの記事に本文を付与して返す(取得した本文はディスクにキャッシュされる)
+FULLTEXT_ENABLED = os.getenv("FULLTEXT_ENABLED") == "1"
+fulltext_fetcher = fulltext.FullTextFetcher()
+# 記事はTTL(14日)で消えるため、それより長い期間の指定は受け付けない
+MAX_DAYS = article_store.STORE_RETENTION_DAYS
 
 
 @app.get("/")
 def read_root():
     return {"message": "AI news summary API healthy", "status": "healthy"}
 
+@app.get("/usage")
+def read_usage():
+    # Bedrockのトークン使用量(キャッシュの読み書きを含む)のプロセス起動からの累計
+    return news_summary.usage_snapshot()
+
 @app.get("/predict")
-def main(days=7,table_name='ai_news'):
+def main(request: Request, days: int = Query(7, ge=1, le=MAX_DAYS), table_name='ai_news', topic=None,
+         top_k: int = Query(20, ge=1)):
     try:
+        if_none_match = request.headers.get("if-none-match")
+        accept_encoding = request.headers.get("accept-encoding")
+        cache_key = (str(days), table_name, topic, str(top_k))
+
+        # 直近で同じパラメータに返したETagと一致すれば、DynamoDBもLLMも呼ばずに304を返す
+        cached_etag = response_cache.get_etag(cache_key)
+        if http_response.etag_matches(if_none_match, cached_etag):
+            print("=======================ETagが一致したため304を返します。=======================")
+            return http_response.not_modified_response(cached_etag, if_none_match)
+
         print("=======================ニュースデータの取得を開始します。=======================")
-        news_data = get_dynamod_data.get_dynamo_data(days=days, table_name=table_name)
-        print(f"=======================ニュースデータの取得が完了しました。=======================")
-        print(news_data)
-        print("=======================ニュースの要約を開始します。=======================")
-        summary = news_summary.summarize_news_with_LLM(news_data)
-        print("=======================ニュースの要約が完了しました。=======================")
-        print(summary)
-        # Parse the summary JSON string to dict/list
-        import json
+        news_data = select_articles(days, table_name, topic, top_k)
+        # 記事には埋め込みベクトル(バイナリ)が含まれるため、内容ではなく件数のみを出力する
+        print(f"=======================ニュースデータの取得が完了しました。({len(news_data)} 件)=======================")
+
+        etag = http_response.compute_etag(news_data, news_summary.prompt_version())
+        response_cache.set_etag(cache_key, etag)
+        if http_response.etag_matches(if_none_match, etag):
+            print("=======================記事集合に変化がないため304を返します。=======================")
+            return http_response.not_modified_response(etag, if_none_match)
+
         try:
-            parsed_summary = json.loads(summary)
-            return JSONResponse(content=parsed_summary)
-        except json.JSONDecodeError as e:
-            print(f"[ERROR] Failed to parse summary JSON: {e}")
-            print(f"[DEBUG] Raw summary: {summary}")
-            return JSONResponse(content={"error": f"JSON parse error: {str(e)}"}, status_code=500)
+            body = summarize_to_body(news_data, etag)
+        except ValueError as e:
+            return JSONResponse(content={"error": str(e)}, status_code=500)
+        return http_response.json_response(body, etag=etag, accept_encoding=accept_encoding)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+def summarize_to_body(news_data, etag):
+    # 同じ記事集合の要約が既にあれば再利用し、無ければLLMで要約してETagに紐づけて保持する
+    body = response_cache.get_body(etag)
+    if body is not None:
+        return body
+    print("=======================ニュースの要約を開始します。=======================")
+    summary = news_summary.summarize_news_with_LLM(news_data)
+    print("=======================ニュースの要約が完了しました。=======================")
+    print(summary)
+    # Parse the summary JSON string to dict/list (コードフェンスや途中で切れたJSONは修復して読み込む)
+    try:
+        parsed_summary = summary_schema.parse_llm_json(summary)
+    except ValueError as e:
+        print(f"[ERROR] Failed to parse summary JSON: {e}")
+        print(f"[DEBUG] Raw summary: {summary}")
+        raise
+    if FULLTEXT_ENABLED and isinstance(parsed_summary, list):
+        print("=======================優先度の高い記事の本文を取得します。=======================")
+        fulltext.attach_full_text(parsed_summary, fulltext_fetcher)
+    body = json.dumps(parsed_summary, ensure_ascii=False).encode("utf-8")
+    response_cache.set_body(etag, body)
+    return body
+
+
+def select_articles(days, table_name, topic=None, top_k=20):
+    news_data = news_store.get_articles(days=days, table_name=table_name)
+    if topic:
+        # トピック指定時は、埋め込みベクトルの類似度上位の記事のみをLLMへ渡す
+        news_data = embedding.search(news_data, topic, top_k=top_k)
+        print(f"=======================トピック「{topic}」に関連する {len(news_data)} 件を選択しました。=======================")
+    return news_data
+
+
+def run_summary_job(days, table_name, topic=None, top_k=20):
+    news_data = select_articles(days, table_name, topic, top_k)
+    etag = http_response.compute_etag(news_data, news_summary.prompt_version())
+    response_cache.set_etag((str(days), table_name, topic, str(top_k)), etag)
+    body = summarize_to_body(news_data, etag)
+    return {"etag": etag, "summary": json.loads(body)}
+
+
+@app.post("/jobs", status_code=202)
+def create_job(days: int = Query(7, ge=1, le=MAX_DAYS), table_name='ai_news', topic=None, top_k: int = Query(20, ge=1)):
+    # LLMの完了を待たずにジョブIDを返す。同じパラメータのジョブは重複排除される
+    job = job_manager.submit((str(days), table_name, topic, str(top_k)), run_summary_job,
+                             days=days, table_name=table_name, topic=topic, top_k=top_k)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"job not found: {job_id}"}, status_code=404)
+    content = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == jobs.SUCCEEDED:
+        content["result"] = job["result"]["summary"]
+        content["etag"] = job["result"]["etag"]
+    elif job["status"] == jobs.FAILED:
+        content["error"] = job["error"]
+    return content
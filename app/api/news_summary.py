@@ -4,10 +4,18 @@ import json
 import time
 import logging
 import traceback
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from langchain_core.prompts import PromptTemplate
 import os
+import hashlib
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
+from app.api import relevance
+from app.api import summary_schema
+from app.api import bedrock_gateway
+from app.batch import near_dup
 
 logger = logging.getLogger(__name__)
 
@@ -19,53 +27,166 @@ def load_api_key():
     os.environ["AWS_BEARER_TOKEN_BEDROCK"] = os.getenv("Bedrock_API_Key")
     logger.info("  [Sub] 環境変数のセットアップが完了しました。")
 
-def create_response(prompt_text,news_data):
-    logger.info("    [API] Boto3 Bedrock クライアントを初期化中...")
-    client = boto3.client("bedrock-runtime")
+# バッチで付与する内部用の属性。LLMの判定には不要なのでプロンプトから除く
+PROMPT_EXCLUDED_FIELDS = {"embedding", "embedding_model", "category_bucket"}
+# BEDROCK_PROMPT_CACHING=1 の場合、prompt.txtの固定部分をBedrockのプロンプトキャッシュに載せる
+# (キャッシュ対応モデルのみ。対応モデルは bedrock_gateway.PROMPT_CACHING_MODELS を参照)
+PROMPT_CACHING_ENABLED = os.getenv("BEDROCK_PROMPT_CACHING") == "1"
+# キャッシュ利用時、固定部分の中で記事データを参照している箇所に入れる文言
+NEWS_DATA_LABEL = "「AI関連ニュースデータ」"
+# レスポンスのusageから集計したトークン数(プロセス起動からの累計。/usage で参照できる)
+usage_stats = {"input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+_usage_lock = threading.Lock()
+
+def split_prompt(prompt_text, news_data):
+    # 最後の {news_data} より前を固定のsystem、記事データ以降を可変のuserとして分割する
+    prefix, marker, suffix = prompt_text.rpartition("{news_data}")
+    if not marker:
+        prefix, suffix = prompt_text, ""
+    system_text = PromptTemplate.from_template(prefix).format(news_data=NEWS_DATA_LABEL)
+    user_text = str(news_data) + PromptTemplate.from_template(suffix).format(news_data=NEWS_DATA_LABEL)
+    return system_text, user_text
+
+def usage_snapshot():
+    with _usage_lock:
+        return dict(usage_stats)
+
+def read_response_body(response):
+    # レスポンスボディを読み込み、usage(キャッシュの読み書きを含む)を記録する
+    response_body = json.loads(response.get("body").read())
+    usage = response_body.get("usage") or {}
+    with _usage_lock:
+        for key in usage_stats:
+            usage_stats[key] += int(usage.get(key) or 0)
+        totals = dict(usage_stats)
+    if usage:
+        logger.info(f"    [API] usage: 入力 {usage.get('input_tokens')} / 出力 {usage.get('output_tokens')} / "
+                    f"キャッシュ読込 {usage.get('cache_read_input_tokens', 0)} / キャッシュ書込 {usage.get('cache_creation_input_tokens', 0)}")
+        logger.info(f"    [API] usage累計: {totals}")
+    return response_body
+
+# client / model_id / gateway はオフライン評価などで差し替える場合のみ指定する(既定のモデルはbedrock_gatewayで設定)
+def create_response(prompt_text,news_data,client=None,model_id=None,gateway=None):
+    if client is None:
+        logger.info("    [API] Boto3 Bedrock クライアントを初期化中...")
+        # スロットリング・一時的なエラーの再試行はbedrock_gatewayで行うため、クライアント側の再試行は無効にする
+        client = boto3.client("bedrock-runtime", config=Config(retries={"max_attempts": 1, "mode": "standard"}))
+
+    gateway = gateway or bedrock_gateway.default_gateway
+    model_id = model_id or gateway.model_id
 
     logger.info("    [API] プロンプトをテンプレートに流し込んでいます...")
-    prompt = PromptTemplate(
-        input_variables=["news_data"],
-        template = prompt_text)
-    prompt = prompt.format(news_data=news_data)
+    payload = {}
+    use_cache = PROMPT_CACHING_ENABLED and bedrock_gateway.supports_prompt_caching(model_id)
+    if PROMPT_CACHING_ENABLED and not use_cache:
+        logger.warning(f"    [API] {model_id} はプロンプトキャッシュに対応していないため、キャッシュを使わずに送信します。")
+    if use_cache:
+        # 固定の指示部分はsystemに置いてキャッシュのチェックポイントを付け、記事データのみをuserで送る
+        system_text, user_text = split_prompt(prompt_text, news_data)
+        payload["system"] = [{"type":"text","text":system_text,"cache_control":{"type":"ephemeral"}}]
+        messages = [{"role":"user","content":user_text}]
+    else:
+        prompt = PromptTemplate(
+            input_variables=["news_data"],
+            template = prompt_text)
+        prompt = prompt.format(news_data=news_data)
+        messages = [{"role":"user","content":prompt}]
 
     body = json.dumps({
-        "messages":[
-            {"role":"user","content":prompt}
-        ],
+        **payload,
+        "messages":messages,
         "max_tokens":4096,
         "temperature":0.5,
-        "anthropic_version":"bedrock-2023-05-31"
+        "anthropic_version":"bedrock-2023-05-31",
+        # ツール利用で、スキーマに沿った構造化出力を要求する
+        "tools":[summary_schema.TOOL_DEFINITION],
+        "tool_choice":{"type":"tool","name":summary_schema.TOOL_NAME}
     })
 
-    model_id = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-
     start_time = time.time()
     logger.info(f"    [API] Bedrock ({model_id}) へのリクエストを送信しました。応答待機中...")
     
-    response = client.invoke_model(
-        modelId=model_id,
-        body=body
-    )
+    response = gateway.invoke(client, body, model_id=model_id)
 
     end_time = time.time()
     logger.info(f"    [API] レスポンスを受信しました。 (所要時間: {end_time - start_time:.2f} 秒)")    
 
     return response
 
-def summarize_news_with_LLM(news_data):
+# プロンプトの内容が変わればETag等のキャッシュキーも変わるよう、内容のハッシュをバージョンとして使う
+@lru_cache(maxsize=1)
+def prompt_version():
+    prompt_path = os.path.join(os.path.dirname(__file__), "prompt.txt")
+    with open(prompt_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def prepare_news_data(news_data, preselect=True):
+    if preselect:
+        # 複数サイトに転載された同じ発表は代表の1件にまとめる
+        news_data = near_dup.collapse_duplicates(news_data)
+        # 明らかなノイズ記事はローカルの関連度モデルで除外し、プロンプトの件数を上限内に抑える
+        news_data = relevance.prefilter_news(news_data)
+    # 埋め込みベクトル等の内部用の属性はプロンプトに含めない
+    return [{key: value for key, value in item.items() if key not in PROMPT_EXCLUDED_FIELDS} for item in news_data]
+
+# preselect=False の場合は近似重複のまとめ・関連度による絞り込みを行わず、渡された記事をすべて判定する(オフライン評価用)
+def summarize_news_with_LLM(news_data, prompt_path=None, client=None, model_id=None, preselect=True, gateway=None):
     logger.info("[Process] 要約メイン処理を開始します。")
-    load_api_key()
+    if client is None:
+        load_api_key()
 
-    prompt_path = os.path.join(os.path.dirname(__file__), "prompt.txt")
+    prompt_path = prompt_path or os.path.join(os.path.dirname(__file__), "prompt.txt")
     f = open(prompt_path,"r",encoding="utf-8")
     prompt_text = f.read()
-    response = create_response(prompt_text,news_data)
+
+    news_data = prepare_news_data(news_data, preselect)
+    response = create_response(prompt_text,news_data,client=client,model_id=model_id,gateway=gateway)
 
     logger.info("[Process] レスポンスボディを解析中...")
-    response_body = json.loads(response.get("body").read())
-    answer = response_body["content"][0]["text"]
-    return answer
+    output = extract_output(read_response_body(response))
+    if isinstance(output, str):
+        try:
+            output = summary_schema.parse_llm_json(output)
+        except ValueError as e:
+            logger.warning(f"[Process] JSONとして解釈できない出力です: {e}")
+            return output
+    judgements = repair_judgements(output, news_data, prompt_text, client=client, model_id=model_id, gateway=gateway)
+    return json.dumps(judgements, ensure_ascii=False)
+
+def extract_output(response_body):
+    # ツール利用の結果(構造化済み)があればそれを、無ければテキストを返す
+    for block in response_body.get("content", []):
+        if block.get("type") == "tool_use" and block.get("name") == summary_schema.TOOL_NAME:
+            return block.get("input")
+    return response_body["content"][0]["text"]
+
+def repair_judgements(output, news_data, prompt_text, client=None, model_id=None, gateway=None):
+    # スキーマ違反の要素と、出力が途中で切れる等で判定が無かった記事だけを、該当記事のみの短いプロンプトで再判定する
+    # (全件の再実行はしない)。判定結果の基準がそろうよう、再判定もメインの判定と同じモデルで行う
+    valid, invalid = summary_schema.validate_judgements(output)
+    judged = {item["link"] for _, item in valid}
+    retry_news = [item for item in news_data if item.get("link") is not None and item.get("link") not in judged]
+    if retry_news:
+        logger.info(f"[Process] スキーマ違反 {len(invalid)} 件を含む、判定の得られなかった {len(retry_news)} 件を再判定します。")
+        retried = {}
+        try:
+            response = create_response(prompt_text, retry_news, client=client, model_id=model_id, gateway=gateway)
+            retry_output = extract_output(read_response_body(response))
+            if isinstance(retry_output, str):
+                retry_output = summary_schema.parse_llm_json(retry_output)
+            retried = {item["link"]: item for _, item in summary_schema.validate_judgements(retry_output)[0]}
+        except Exception as e:
+            logger.warning(f"[Process] 再判定に失敗しました: {e}")
+        # スキーマ違反だった要素は元の位置に、判定漏れの記事は末尾に入力順で並べる
+        positions = {item.get("link"): index for index, item in invalid if isinstance(item, dict)}
+        tail = len(valid) + len(invalid)
+        for offset, item in enumerate(retry_news):
+            if item["link"] in retried:
+                valid.append((positions.get(item["link"], tail + offset), retried[item["link"]]))
+    if not valid and news_data:
+        # max_tokensでの打ち切り等で判定が1件も得られなかった場合、空の結果を返すとETagに紐づいてキャッシュされるためエラーにする
+        raise ValueError(f"LLMの出力から有効な判定が得られませんでした (記事 {len(news_data)} 件, スキーマ違反 {len(invalid)} 件)")
+    return [item for _, item in sorted(valid, key=lambda pair: pair[0])]
 
 # 動作確認
 if __name__ == "__main__":
@@ -0,0 +1,275 @@
+"""プロンプト・モデル変更のオフライン評価ハーネス
+
+PoCのラベル付きデータを summarize_news_with_LLM に流し、トークン数・所要時間・JSONの妥当性と、
+ベースラインに対する priority / category の一致率をバリアント(プロンプト×モデル×前処理)ごとに比較する。
+
+既定では近似重複のまとめ・関連度モデルによる絞り込み(前処理)を行わず、全記事をLLMに判定させる。
+関連度モデルは評価と同じ correct_priority で学習しているため、前処理ありの一致率はプロンプトの性能だけでなく
+関連度モデルの(学習データ上の)当てはまりも含む。json_valid はローカルでの修復・再判定前の、
+モデルの最初の出力がそのままスキーマを満たしたかを表す。latency はバックエンドの呼び出しにかかった時間の合計で、
+ゲートウェイでの待ち時間は含まない(fake / recorded はトークン予算を持たない専用のゲートウェイで並列に実行する)。
+
+    python -m app.api.prompt_eval --prompt app/api/prompt.txt --prompt PoC/prompt.txt
+    python -m app.api.prompt_eval --backend recorded --recording PoC/recording.json --output result.csv
+    python -m app.api.prompt_eval --preselect both
+
+--backend
+    fake     : 記事ごとに決定的な判定を返す偽のBedrock(既定。トークン数・所要時間・パイプラインの検証用)
+    recorded : --recording に保存したレスポンスを再生する(記録が無いリクエストはエラー)
+    bedrock  : 実際のBedrockを呼び、--recording を指定した場合はレスポンスを記録する
+"""
+import os
+import io
+import re
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from app.api import news_summary
+from app.api import summary_schema
+from app.api import bedrock_gateway
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
+DEFAULT_DATA_PATH = os.path.join(PROJECT_ROOT, "PoC/news_data_0404.json")
+DEFAULT_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt.txt")
+_LINK_PATTERN = re.compile(r"'link': '([^']+)'")
+# 偽・記録済みバックエンドで同時に処理する呼び出し数の上限(実際のBedrockは呼ばないため高めにする)
+LOCAL_BACKEND_CONCURRENCY = 64
+
+
+def _response(payload):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return {"body": io.BytesIO(body)}
+
+
+class FakeBedrockClient:
+    """プロンプト中の記事リンクを全件 Low と判定し、文字数から概算したusageを返す"""
+
+    def invoke_model(self, modelId, body):
+        request = json.loads(body)
+        text = json.dumps(request.get("system", ""), ensure_ascii=False) + json.dumps(request["messages"], ensure_ascii=False)
+        links = list(dict.fromkeys(_LINK_PATTERN.findall(text)))
+        items = [{"link": link, "category": "Other/Noise", "priority": "Low", "reason": "fake backend"}
+                 for link in links]
+        output = json.dumps({"items": items}, ensure_ascii=False)
+        return _response({
+            "content": [{"type": "tool_use", "name": summary_schema.TOOL_NAME, "input": {"items": items}}],
+            "usage": {"input_tokens": len(text) // 3, "output_tokens": len(output) // 3},
+        })
+
+
+class RecordingClient:
+    """リクエスト(モデルID+ボディ)のハッシュをキーにレスポンスを記録・再生する"""
+
+    def __init__(self, path, inner=None):
+        self.path = path
+        self.inner = inner
+        self._lock = threading.Lock()
+        self.recordings = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.recordings = json.load(f)
+
+    @staticmethod
+    def key(model_id, body):
+        return hashlib.sha256(f"{model_id}\n{body}".encode("utf-8")).hexdigest()
+
+    def invoke_model(self, modelId, body):
+        key = self.key(modelId, body)
+        with self._lock:
+            recorded = self.recordings.get(key)
+        if recorded is not None:
+            return _response(recorded)
+        if self.inner is None:
+            raise KeyError(f"記録されていないリクエストです (model={modelId}, key={key[:12]})")
+        payload = json.loads(self.inner.invoke_model(modelId=modelId, body=body)["body"].read())
+        with self._lock:
+            self.recordings[key] = payload
+        return _response(payload)
+
+    def save(self):
+        if self.path and self.inner is not None:
+            with self._lock, open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.recordings, f, ensure_ascii=False)
+
+
+class MeteredClient:
+    """バリアントごとの呼び出し回数・usage・バックエンドの応答時間を集計するラッパー"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.raw_bodies = []
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        # ゲートウェイでの待ち時間を含めないよう、バックエンドの呼び出しのみを計測する
+        start = time.time()
+        raw = self.inner.invoke_model(modelId=modelId, body=body)["body"].read()
+        latency = time.time() - start
+        usage = json.loads(raw).get("usage") or {}
+        with self._lock:
+            self.calls += 1
+            self.latency += latency
+            self.raw_bodies.append(raw)
+            self.input_tokens += int(usage.get("input_tokens") or 0) + int(usage.get("cache_read_input_tokens") or 0) \
+                + int(usage.get("cache_creation_input_tokens") or 0)
+            self.output_tokens += int(usage.get("output_tokens") or 0)
+        return _response(raw)
+
+
+def load_baseline(news_data, baseline_path=None):
+    # 既定はデータセットの正解ラベル(correct_priority)。ベースラインファイルがあればcategoryも比較する
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            return {item["link"]: item for item in json.load(f) if isinstance(item, dict) and "link" in item}
+    return {item["link"]: {"priority": item["correct_priority"]}
+            for item in news_data if item.get("correct_priority")}
+
+def agreement(judgements, baseline, field):
+    compared = [(item.get(field), baseline[item["link"]][field]) for item in judgements
+                if item.get("link") in baseline and baseline[item["link"]].get(field) is not None]
+    if not compared:
+        return None
+    return sum(1 for got, expected in compared if got == expected) / len(compared)
+
+def raw_output_valid(raw_body):
+    # 修復(コードフェンス除去・途中で切れたJSONの補完・再判定)なしで、出力がスキーマを満たすか
+    try:
+        output = news_summary.extract_output(json.loads(raw_body))
+        if isinstance(output, str):
+            output = json.loads(output)
+    except (ValueError, KeyError, IndexError, TypeError):
+        return False
+    valid, invalid = summary_schema.validate_judgements(output)
+    return bool(valid) and not invalid
+
+def build_gateway(backend):
+    # 実際のBedrockを呼ばないバックエンドは、本番と共有のトークン予算・同時実行数に縛られないよう専用のゲートウェイを使う
+    if isinstance(backend, FakeBedrockClient) or (isinstance(backend, RecordingClient) and backend.inner is None):
+        limiter = bedrock_gateway.AIMDLimiter(initial=LOCAL_BACKEND_CONCURRENCY, maximum=LOCAL_BACKEND_CONCURRENCY)
+        return bedrock_gateway.BedrockGateway(limiter=limiter, budget=bedrock_gateway.UnlimitedBudget())
+    return bedrock_gateway.default_gateway
+
+def run_variant(news_data, prompt_path, model_id, backend, baseline, preselect=False, gateway=None):
+    client = MeteredClient(backend)
+    error = None
+    sent = []
+    try:
+        # 実際にLLMへ渡す記事をここで確定させ、件数を記録する
+        sent = news_summary.prepare_news_data(news_data, preselect)
+        summary = news_summary.summarize_news_with_LLM(sent, prompt_path=prompt_path, client=client,
+                                                       model_id=model_id, preselect=False, gateway=gateway)
+    except Exception as e:
+        summary, error = None, str(e)
+
+    try:
+        judgements = json.loads(summary) if summary is not None else None
+    except json.JSONDecodeError:
+        judgements = None
+    judgements = judgements if isinstance(judgements, list) else []
+    return {
+        "prompt": os.path.relpath(prompt_path, PROJECT_ROOT),
+        "model": model_id or "default",
+        "preselect": preselect,
+        "articles": len(news_data),
+        "sent": len(sent),
+        "calls": client.calls,
+        "input_tokens": client.input_tokens,
+        "output_tokens": client.output_tokens,
+        "latency": round(client.latency, 3),
+        "json_valid": bool(client.raw_bodies) and raw_output_valid(client.raw_bodies[0]),
+        "judged": len(judgements),
+        "priority_agreement": agreement(judgements, baseline, "priority"),
+        "category_agreement": agreement(judgements, baseline, "category"),
+        "error": error,
+        "judgements": judgements,
+    }
+
+def run_evaluation(news_data, prompt_paths, model_ids, backend, baseline, workers=4, preselect_modes=(False,),
+                   gateway=None):
+    gateway = gateway or build_gateway(backend)
+    # 正解ラベルがプロンプトに混ざらないよう取り除いてから流す
+    news_data = [{key: value for key, value in item.items() if key != "correct_priority"} for item in news_data]
+    variants = list(itertools.product(prompt_paths, model_ids, preselect_modes))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(variants)))) as executor:
+        return list(executor.map(lambda v: run_variant(news_data, v[0], v[1], backend, baseline, preselect=v[2],
+                                                       gateway=gateway),
+                                 variants))
+
+PRESELECT_MODES = {"off": (False,), "on": (True,), "both": (False, True)}
+TABLE_COLUMNS = ["prompt", "model", "preselect", "articles", "sent", "calls", "input_tokens", "output_tokens", "latency",
+                 "json_valid", "judged", "priority_agreement", "category_agreement", "error"]
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
+
+def format_table(results):
+    rows = [[_format(result[column]) for column in TABLE_COLUMNS] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(TABLE_COLUMNS)]
+    lines = ["| " + " | ".join(column.ljust(width) for column, width in zip(TABLE_COLUMNS, widths)) + " |",
+             "|" + "|".join("-" * (width + 2) for width in widths) + "|"]
+    lines += ["| " + " | ".join(value.ljust(width) for value, width in zip(row, widths)) + " |" for row in rows]
+    return "\n".join(lines)
+
+def write_csv(results, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+def build_backend(args):
+    if args.backend == "fake":
+        return FakeBedrockClient()
+    if args.backend == "recorded":
+        return RecordingClient(args.recording)
+    import boto3
+    news_summary.load_api_key()
+    inner = boto3.client("bedrock-runtime")
+    return RecordingClient(args.recording, inner=inner) if args.recording else inner
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="プロンプト・モデルのオフライン評価")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="評価データ(JSON)")
+    parser.add_argument("--prompt", action="append", help="評価するプロンプトファイル(複数指定可)")
+    parser.add_argument("--model", action="append", help="評価するモデルID(複数指定可。省略時は既定のモデル)")
+    parser.add_argument("--backend", choices=["fake", "recorded", "bedrock"], default="fake")
+    parser.add_argument("--recording", help="recorded/bedrockバックエンドの記録ファイル")
+    parser.add_argument("--baseline", help="比較するベースライン(判定結果のJSON)。省略時はcorrect_priority")
+    parser.add_argument("--write-baseline", help="最初のバリアントの判定結果をベースラインとして保存する")
+    parser.add_argument("--preselect", choices=sorted(PRESELECT_MODES), default="off",
+                        help="近似重複のまとめ・関連度による絞り込みを行うか(on は関連度モデルの学習ラベルと評価ラベルが同じ点に注意)")
+    parser.add_argument("--workers", type=int, default=4, help="並列に実行するバリアント数")
+    parser.add_argument("--output", help="比較表をCSVで保存する")
+    args = parser.parse_args(argv)
+
+    with open(args.data, encoding="utf-8") as f:
+        news_data = json.load(f)
+    baseline = load_baseline(news_data, args.baseline)
+    backend = build_backend(args)
+
+    results = run_evaluation(news_data, args.prompt or [DEFAULT_PROMPT_PATH], args.model or [None],
+                             backend, baseline, workers=args.workers, preselect_modes=PRESELECT_MODES[args.preselect])
+    if isinstance(backend, RecordingClient):
+        backend.save()
+
+    print(format_table(results))
+    if args.output:
+        write_csv(results, args.output)
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(results[0]["judgements"], f, ensure_ascii=False, indent=2)
+    return results
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,62 @@
+import os
+import json
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# LLMへ渡す前に、ローカルの軽量モデルで記事の関連度をスコアリングして件数を絞る
+# 学習データはPoCで人手ラベル付けした記事(correct_priority: High/Medium/Low)
+TRAINING_DATA_PATH = os.getenv(
+    "RELEVANCE_TRAINING_DATA",
+    os.path.join(os.path.dirname(__file__), "../../PoC/news_data_0404.json"))
+# LLMへ渡す最大件数。これ以下の件数ならスコアリング自体を行わない
+RELEVANCE_TOP_K = int(os.getenv("RELEVANCE_TOP_K", "40"))
+# 指定した場合、このスコア未満の記事はTop-K内でも除外する
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD")) if os.getenv("RELEVANCE_THRESHOLD") else None
+
+
+def article_text(item):
+    return f"{item.get('title', '')} {item.get('summary', '')}"
+
+@lru_cache(maxsize=1)
+def load_model(path=TRAINING_DATA_PATH):
+    # scikit-learnの読み込みは重いため、初めてスコアリングが必要になったときにプロセスで1度だけ学習する
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    with open(path, encoding="utf-8") as f:
+        labeled = json.load(f)
+    texts = [article_text(item) for item in labeled]
+    # High/Mediumを「読む価値あり」、Lowを「ノイズ」とする2値分類
+    labels = [0 if item.get("correct_priority") == "Low" else 1 for item in labeled]
+
+    # 文字n-gramなので、分かち書きなしで日本語と英語の両方を扱える
+    model = make_pipeline(
+        TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 3), sublinear_tf=True, min_df=2),
+        LogisticRegression(class_weight="balanced", max_iter=1000),
+    )
+    model.fit(texts, labels)
+    logger.info(f"[Relevance] 関連度モデルを学習しました (学習件数: {len(labeled)})")
+    return model
+
+def score_news(news_data):
+    if not news_data:
+        return []
+    model = load_model()
+    return model.predict_proba([article_text(item) for item in news_data])[:, 1].tolist()
+
+def prefilter_news(news_data, top_k=RELEVANCE_TOP_K, threshold=RELEVANCE_THRESHOLD):
+    # スコア上位top_k件(かつthreshold以上)のみを、元の順序を保って返す
+    news_data = list(news_data)
+    if len(news_data) <= top_k and threshold is None:
+        return news_data
+
+    scores = score_news(news_data)
+    ranked = sorted(range(len(news_data)), key=lambda i: scores[i], reverse=True)[:top_k]
+    if threshold is not None:
+        ranked = [i for i in ranked if scores[i] >= threshold]
+    selected = sorted(ranked)
+    logger.info(f"[Relevance] {len(news_data)} 件中 {len(selected)} 件をLLMへ渡します。")
+    return [news_data[i] for i in selected]
@@ -0,0 +1,101 @@
+import re
+import json
+from typing import Literal
+from pydantic import BaseModel, ValidationError
+
+# LLMの出力(記事ごとのカテゴリ・優先度判定)のスキーマと、崩れたJSONを修復するパーサー
+
+
+# prompt.txt のカテゴリ分類基準と同じ表記(Carrer の綴りもプロンプトに合わせる)
+Category = Literal["CaseStudy/Impact", "Tech/Library", "Carrer", "Research/Paper", "Biz/Trend", "Other/Noise"]
+
+
+class NewsJudgement(BaseModel):
+    link: str
+    category: Category
+    priority: Literal["High", "Medium", "Low"]
+    reason: str
+
+
+# Bedrock(Anthropic)のツール利用で構造化出力を要求するためのツール定義
+TOOL_NAME = "record_news_judgements"
+TOOL_DEFINITION = {
+    "name": TOOL_NAME,
+    "description": "記事ごとのカテゴリ分類・優先度判定の結果を記録する",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": NewsJudgement.model_json_schema()}
+        },
+        "required": ["items"],
+    },
+}
+
+_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_CLOSERS = {"[": "]", "{": "}"}
+
+
+def strip_code_fences(text):
+    match = _FENCE_PATTERN.search(text)
+    return match.group(1) if match else text
+
+def repair_truncated_json(text):
+    # 途中で切れたJSONを、最後に完結している要素の直後で切り、開いている括弧を閉じる
+    stack = []
+    in_string = False
+    escape = False
+    safe_end, safe_stack = None, None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append(ch)
+        elif ch in "]}":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[:i + 1]
+            safe_end, safe_stack = i + 1, list(stack)
+        elif ch == ",":
+            safe_end, safe_stack = i, list(stack)
+    if safe_end is None:
+        raise ValueError("JSON parse error: no complete element to recover")
+    return text[:safe_end] + "".join(_CLOSERS[ch] for ch in reversed(safe_stack))
+
+def parse_llm_json(text):
+    # コードフェンスや前後の説明文を除き、必要なら切れたJSONを修復して読み込む
+    text = strip_code_fences(text)
+    starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+    if not starts:
+        raise ValueError("JSON parse error: no JSON found in model output")
+    candidate = text[min(starts):]
+    try:
+        return json.JSONDecoder().raw_decode(candidate)[0]
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(repair_truncated_json(candidate))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON parse error: {e}")
+
+def validate_judgements(items):
+    # スキーマを満たす要素と、満たさない要素(インデックス, 元の値)に分ける
+    if isinstance(items, dict) and "items" in items:
+        items = items["items"]
+    if not isinstance(items, list):
+        items = [items]
+    valid, invalid = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, NewsJudgement.model_validate(item).model_dump()))
+        except ValidationError:
+            invalid.append((index, item))
+    return valid, invalid
@@ -1,28 +1,36 @@
-import pandas as pd
+import math
 import boto3
 from botocore.exceptions import ClientError
-from langchain_core.prompts import PromptTemplate
-from dotenv import load_dotenv
-import numpy as np
 
 
-# 一括書き込み。batch_writerを使用すると、DynamoDBの制限に基づいて自動的にバッチを分割してくれる。
-def dynamo_batch_write(news_df, table_name, region_name='ap-northeast-1'):
-    news_data = news_df.to_dict(orient='records')
-    #JSONファイルの読み込み
-    # dynamodbの設定
+# NaN/Noneの項目はDynamoDBへ書き込まない
+def drop_empty_values(item):
+    return {key: value for key, value in item.items()
+            if value is not None and not (isinstance(value, float) and math.isnan(value))}
+
+# ストリーム書き込み。itemsはdictを1件ずつ返すイテラブル(ジェネレータ)で、届いた順にbatch_writerへ流す。
+# batch_writerは25件単位でフラッシュするため、全件をメモリに載せずに書き込める。
+def dynamo_stream_write(items, table_name, region_name='ap-northeast-1'):
     dynamodb = boto3.resource('dynamodb', region_name=region_name)
     table = dynamodb.Table(table_name)
 
+    count = 0
     with table.batch_writer() as batch:
-        for item in news_data:
-            item_not_has_nan = {key: item[key] for key in item if item[key] is not np.nan}
-            batch.put_item(Item=item_not_has_nan)
-    print(f"Successfully wrote {len(news_data)} items to {table_name} table.")
+        for item in items:
+            batch.put_item(Item=drop_empty_values(item))
+            count += 1
+    print(f"Successfully wrote {count} items to {table_name} table.")
+    return count
+
+# 一括書き込み。batch_writerを使用すると、DynamoDBの制限に基づいて自動的にバッチを分割してくれる。
+def dynamo_batch_write(news_df, table_name, region_name='ap-northeast-1'):
+    news_data = news_df.to_dict(orient='records')
+    dynamo_stream_write(news_data, table_name, region_name=region_name)
     return "Successfully wrote to DynamoDB"
 
 # 動作確認
 if __name__ == "__main__":
+    import pandas as pd
     # テスト用のサンプルデータを作成
     sample_data = {
         'title': ['Sample News 1', 'Sample News 2'],
@@ -31,7 +39,3 @@ if __name__ == "__main__":
     news_df = pd.DataFrame(sample_data)
     table_name = 'ai_news'
     dynamo_batch_write(news_df, table_name, region_name='ap-northeast-1')
-
-# 動作確認
-if __name__ == "__main__":
-    dynamo_batch_write(news_df, table_name, region_name='ap-northeast-1')
@@ -0,0 +1,104 @@
+import os
+import re
+import json
+import math
+import zlib
+from collections import Counter
+import numpy as np
+
+# 記事のトピック検索用の埋め込みベクトル
+# 既定はネットワーク不要の特徴ハッシュ(文字2-3gramを符号付きでEMBEDDING_DIM次元へ写像)で、
+# EMBEDDING_BACKEND=bedrock の場合はBedrockの埋め込みモデルを使う。
+# ベクトルはfloat16のバイト列としてアイテムの embedding 属性に保存する(512次元で1KB)。
+EMBEDDING_DIM = 512
+EMBEDDING_ATTRIBUTE = "embedding"
+EMBEDDING_MODEL_ATTRIBUTE = "embedding_model"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hashing")
+BEDROCK_EMBEDDING_MODEL = os.getenv("BEDROCK_EMBEDDING_MODEL", "amazon.titan-embed-text-v2:0")
+
+
+def article_text(item):
+    return f"{item.get('title', '')} {item.get('summary', '')}"
+
+def _grams(text, sizes=(2, 3)):
+    text = re.sub(r"[\W_]+", " ", str(text or "").lower()).strip()
+    for word in text.split():
+        for size in sizes:
+            if len(word) < size:
+                continue
+            for i in range(len(word) - size + 1):
+                yield word[i:i + size]
+
+
+class HashingEmbedder:
+    model_name = f"hashing-char23-{EMBEDDING_DIM}"
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram, count in Counter(_grams(text)).items():
+            h = zlib.crc32(gram.encode("utf-8"))
+            sign = 1.0 if (h // self.dim) % 2 == 0 else -1.0
+            vector[h % self.dim] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class BedrockEmbedder:
+    model_name = BEDROCK_EMBEDDING_MODEL
+
+    def __init__(self, client=None, dim=EMBEDDING_DIM):
+        import boto3
+        self.client = client or boto3.client("bedrock-runtime")
+        self.dim = dim
+
+    def embed(self, text):
+        body = json.dumps({"inputText": text[:8000], "dimensions": self.dim, "normalize": True})
+        response = self.client.invoke_model(modelId=self.model_name, body=body)
+        return np.asarray(json.loads(response["body"].read())["embedding"], dtype=np.float32)
+
+
+_default_embedder = None
+
+def default_embedder():
+    global _default_embedder
+    if _default_embedder is None:
+        _default_embedder = BedrockEmbedder() if EMBEDDING_BACKEND == "bedrock" else HashingEmbedder()
+    return _default_embedder
+
+def to_bytes(vector):
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+def from_bytes(raw):
+    # boto3のBinary型(.value)とbytesの両方を受け付ける
+    return np.frombuffer(getattr(raw, "value", raw), dtype=np.float16)
+
+def tag_embeddings(items, embedder=None):
+    # パイプラインのステージ: 各記事に埋め込みベクトルを付与する
+    embedder = embedder or default_embedder()
+    for item in items:
+        item[EMBEDDING_ATTRIBUTE] = to_bytes(embedder.embed(article_text(item)))
+        item[EMBEDDING_MODEL_ATTRIBUTE] = embedder.model_name
+        yield item
+
+def item_vector(item, embedder):
+    # 保存済みのベクトルが同じモデルのものであれば使い、無ければその場で計算する
+    raw = item.get(EMBEDDING_ATTRIBUTE)
+    if raw is not None and item.get(EMBEDDING_MODEL_ATTRIBUTE) == embedder.model_name:
+        return from_bytes(raw)
+    return np.asarray(embedder.embed(article_text(item)), dtype=np.float16)
+
+def search(news_data, query, top_k=20, min_score=0.05, embedder=None):
+    # クエリとのコサイン類似度(ベクトルは正規化済みなので内積)上位top_k件を、元の順序を保って返す
+    news_data = list(news_data)
+    if not news_data or top_k < 1:
+        return []
+    embedder = embedder or default_embedder()
+    matrix = np.vstack([item_vector(item, embedder) for item in news_data]).astype(np.float32)
+    scores = matrix @ np.asarray(embedder.embed(query), dtype=np.float32)
+    k = min(top_k, len(news_data))
+    top = np.argpartition(-scores, k - 1)[:k]
+    selected = sorted(int(i) for i in top if scores[i] >= min_score)
+    return [news_data[i] for i in selected]
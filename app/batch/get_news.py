@@ -1,11 +1,15 @@
 import feedparser
-import pandas as pd
 import json
 from datetime import datetime
 from bs4 import BeautifulSoup
 import os
+from collections import OrderedDict
 
-def parse_text(entry,today,id_1,id_2,id_3,category,news_df):
+NEWS_COLUMNS = ["id", "category", "title", "link", "published_datetime", "summary", "ttl"]
+# 重複判定のために覚えておくリンク数の上限(これより古いリンクとの重複は検出しない)
+DEDUP_WINDOW = 10000
+
+def parse_text(entry,today,id_1,id_2,id_3,category):
     # published_parsedをintオブジェクトに変換
     struct_time = entry.published_parsed
     dt = datetime(*struct_time[:6])
@@ -24,9 +28,7 @@ def parse_text(entry,today,id_1,id_2,id_3,category,news_df):
     print(f"概要: {entry.summary}")
     print(f"TTL時間: {ttl}")
 
-    addRow = [f"{today}{id_1}{id_2}{id_3}", category,  entry.title, entry.link, published_datetime, entry.summary, ttl]
-    addRow = pd.DataFrame([addRow], columns=["id", "category", "title", "link", "published_datetime", "summary", "ttl"])
-    news_df = pd.concat([news_df, addRow], ignore_index=True)
+    item = dict(zip(NEWS_COLUMNS, [f"{today}{id_1}{id_2}{id_3}", category,  entry.title, entry.link, published_datetime, entry.summary, ttl]))
     print("-" * 30)
 
     if id_3 == 9:
@@ -37,46 +39,82 @@ def parse_text(entry,today,id_1,id_2,id_3,category,news_df):
     else:
         id_3 += 1
 
-    return news_df, id_2, id_3
+    return item, id_2, id_3
+
+# ---- ストリーミングパイプライン: fetch → parse → clean → dedup ----
+# 各ステージはジェネレータで、下流が次の1件を要求したときだけ上流が動く(プル型のバックプレッシャー)。
+# フィードも記事も1件ずつ流れるため、フィード数・記事数が増えてもメモリ使用量はほぼ一定に保たれる
+# (dedup_items が保持するリンクは直近 DEDUP_WINDOW 件まで)。
 
-def get_news_data(RSS_list):
-    id_1 = 1
-    today = datetime.now().strftime("%Y%m%d")
-    category = "AI_news"
-    news_df = pd.DataFrame()
+def fetch_feeds(RSS_list):
+    # RSSを1フィードずつ取得して (フィード番号, feed) を返す
+    for id_1, url in enumerate(RSS_list, start=1):
+        yield id_1, feedparser.parse(url)
 
-    for url in RSS_list:
-        feed = feedparser.parse(url)
+def parse_entries(feeds, today=None, category="AI_news", max_entries=1):
+    if today is None:
+        today = datetime.now().strftime("%Y%m%d")
+    for id_1, feed in feeds:
         id_2 = 0
         id_3 = 1
-        for entry in feed.entries[0:1]:
-            news_df, id_2, id_3 = parse_text(entry,today,id_1,id_2,id_3,category,news_df)
-        id_1 += 1
+        for entry in feed.entries[0:max_entries]:
+            item, id_2, id_3 = parse_text(entry,today,id_1,id_2,id_3,category)
+            yield item
 
-    return news_df
+def clean_items(items):
+    for item in items:
+        if item.get("summary") is not None:
+            item["summary"] = clean_html(item["summary"], strip=True)
+        yield item
 
-# HTMLタグを除去する関数
-def clean_html(html, strip=False):
-    soup = BeautifulSoup(html, 'html.parser')
-    text = soup.get_text(strip=strip)
-    return text
+def dedup_items(items, window=DEDUP_WINDOW):
+    # 同じリンクの記事は最初の1件のみ流す。保持するのは直近window件のリンク文字列のみで、
+    # 上限を超えたら古いものから忘れる(それより前に流れた記事との重複は検出しない)
+    seen_links = OrderedDict()
+    for item in items:
+        link = item.get("link")
+        if link in seen_links:
+            print(f"重複記事をスキップします: {link}")
+            continue
+        seen_links[link] = None
+        if len(seen_links) > window:
+            seen_links.popitem(last=False)
+        yield item
 
-def get_news():
-# 1. このスクリプト(get_news.py)が存在するディレクトリの絶対パスを取得
+def load_rss_list():
+    # 1. このスクリプト(get_news.py)が存在するディレクトリの絶対パスを取得
     base_dir = os.path.dirname(os.path.abspath(__file__))
     # 2. RSS.jsonへの絶対パスを生成
     json_path = os.path.join(base_dir, 'RSS.json')
 
     # 生成したパスでファイルを開く
     with open(json_path, encoding='utf-8') as f:
-        RSS_list = json.load(f)
+        return json.load(f)
 
-    news_df = get_news_data(RSS_list)
-    if 'summary' in news_df.columns:
-        news_df["summary"] = news_df["summary"].apply(lambda x: clean_html(x, strip=True))
-    else:
+def iter_news(RSS_list=None):
+    if RSS_list is None:
+        RSS_list = load_rss_list()
+    feeds = fetch_feeds(RSS_list)
+    items = parse_entries(feeds)
+    items = clean_items(items)
+    return dedup_items(items)
+
+# HTMLタグを除去する関数
+def clean_html(html, strip=False):
+    soup = BeautifulSoup(html, 'html.parser')
+    text = soup.get_text(strip=strip)
+    return text
+
+def get_news_data(RSS_list=None):
+    # デバッグ用: iter_news と同じパイプライン(clean・dedup込み)の結果をDataFrameとしてまとめて返す
+    import pandas as pd
+    return pd.DataFrame(list(iter_news(RSS_list)))
+
+def get_news():
+    news_df = get_news_data()
+    if 'summary' not in news_df.columns:
         print("Warning: 'summary' column is missing.")
     return news_df
 
 if __name__ == "__main__":
-    get_news()
\ No newline at end of file
+    get_news()
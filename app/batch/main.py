@@ -1,9 +1,19 @@
+import os
 import dynamo_write as dynamo_write
 import get_news as get_news
-from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
+import partition as partition
+import embedding as embedding
 
-news_df = get_news.get_news()
-dynamo_write.dynamo_batch_write(news_df, table_name='ai_news')
-print(news_df)
-print("DynamoDBへの書き込みが完了しました。")
\ No newline at end of file
+# fetch → parse → clean → dedup → (埋め込みベクトル付与) → (GSIバケット付与) → write
+# 近似重複(転載記事)のまとめは、期間内の記事がそろうAPI側で要約前に行う (near_dup.collapse_duplicates)
+items = partition.tag_buckets(embedding.tag_embeddings(get_news.iter_news()))
+
+# BATCH_DEBUG_DATAFRAME=1 の場合のみ、従来通りDataFrameにまとめて書き込み・表示する
+if os.getenv("BATCH_DEBUG_DATAFRAME") == "1":
+    import pandas as pd
+    news_df = pd.DataFrame(list(items))
+    dynamo_write.dynamo_batch_write(news_df, table_name='ai_news')
+    print(news_df)
+else:
+    dynamo_write.dynamo_stream_write(items, table_name='ai_news')
+print("DynamoDBへの書き込みが完了しました。")
@@ -0,0 +1,164 @@
+import re
+import time
+import zlib
+import numpy as np
+
+# MinHash + LSHによる近似重複(同じ発表の転載記事)の検出
+# タイトル+概要を、英語などの単語は単語2-gram、日本語(かな・漢字)は文字3-gramのシングル集合にして比較する。
+# 英語の長文は無関係な記事同士でも文字3-gramの大半を共有してしまうため、英語は単語単位で比較する。
+# LSHはシグネチャをBANDS個の帯に分け、いずれかの帯が完全一致した記事のみを候補とし、
+# 候補はシングル集合の正確なJaccard係数で確認してから重複と判定する。
+# 1件あたりの検索コストは帯の数に比例し、蓄積された記事数にはほぼ依存しない。
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # 類似度が約 (1/BANDS)^(1/ROWS) = 0.5 を超えると候補になる(取りこぼしを抑えるため広めに拾う)
+WORD_SHINGLE_SIZE = 2
+CHAR_SHINGLE_SIZE = 3
+SIMILARITY_THRESHOLD = 0.8
+
+# multiply-shift方式のハッシュ族 h(x) = ((a*x + b) mod 2^64) >> 32 をNUM_PERM個用意する
+_rng = np.random.RandomState(20260404)
+_A = _rng.randint(0, 2**62, size=NUM_PERM, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.randint(0, 2**62, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_EMPTY_SIGNATURE = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+# ひらがな・カタカナ(長音符含む)・漢字・半角カナ
+_JAPANESE_CHARS = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff66-\uff9f]")
+_WORD = re.compile(r"[^\W_]+")
+
+
+def _ngrams(tokens, size, sep):
+    if len(tokens) < size:
+        return {sep.join(tokens)} if tokens else set()
+    return {sep.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def shingles(text):
+    # 日本語の文字は連結して文字3-gram、それ以外の単語は単語2-gramにする
+    text = str(text or "").lower()
+    japanese = _JAPANESE_CHARS.findall(text)
+    words = _WORD.findall(_JAPANESE_CHARS.sub(" ", text))
+    return _ngrams(words, WORD_SHINGLE_SIZE, " ") | _ngrams(japanese, CHAR_SHINGLE_SIZE, "")
+
+def shingle_hashes(text):
+    return frozenset(zlib.crc32(s.encode("utf-8")) for s in shingles(text))
+
+def article_text(item):
+    return f"{item.get('title', '')} {item.get('summary', '')}"
+
+def minhash(hash_set):
+    if not hash_set:
+        return _EMPTY_SIGNATURE
+    hashes = np.fromiter(hash_set, dtype=np.uint64, count=len(hash_set))
+    with np.errstate(over="ignore"):
+        permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def jaccard(set_a, set_b):
+    if not set_a or not set_b:
+        return 0.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+
+class NearDuplicateIndex:
+    """LSHの帯ごとのハッシュテーブル。候補を絞ってからシングル集合の正確なJaccard係数で類似度を確認する"""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._bands = [{} for _ in range(BANDS)]
+        self._shingles = {}
+
+    def __len__(self):
+        return len(self._shingles)
+
+    def _band_keys(self, signature):
+        raw = signature.tobytes()
+        width = len(raw) // BANDS
+        return [raw[i*width:(i + 1)*width] for i in range(BANDS)]
+
+    def add(self, key, hash_set, signature=None):
+        if not hash_set:
+            return
+        signature = minhash(hash_set) if signature is None else signature
+        self._shingles[key] = hash_set
+        for band, band_key in zip(self._bands, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+
+    def query(self, hash_set, signature=None):
+        # 類似度が閾値以上の既存キーを、類似度の高い順に返す
+        if not hash_set:
+            return []
+        signature = minhash(hash_set) if signature is None else signature
+        candidates = set()
+        for band, band_key in zip(self._bands, self._band_keys(signature)):
+            candidates.update(band.get(band_key, ()))
+        scored = [(jaccard(hash_set, self._shingles[key]), key) for key in candidates]
+        return [key for score, key in sorted(scored, key=lambda pair: pair[0], reverse=True)
+                if score >= self.threshold]
+
+
+class NearDuplicateClusterer:
+    """記事を1件ずつ受け取り、既存のクラスタの代表記事と近似重複ならそのクラスタIDを引き継ぐ
+
+    索引に登録するのは各クラスタの代表(最初の記事)のみで、A≒B, B≒C から A と C が
+    連鎖的に同じクラスタになることはない。
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD):
+        self.index = NearDuplicateIndex(threshold)
+
+    def assign(self, item, default_key=None):
+        key = item.get("link") or item.get("id") or default_key
+        hash_set = shingle_hashes(article_text(item))
+        signature = minhash(hash_set)
+        matches = self.index.query(hash_set, signature)
+        if matches:
+            return matches[0]
+        self.index.add(key, hash_set, signature)
+        return key
+
+
+def cluster_ids(items):
+    # 記事ごとのクラスタID(代表記事のリンク)を順に返す
+    clusterer = NearDuplicateClusterer()
+    for position, item in enumerate(items):
+        yield clusterer.assign(item, default_key=position)
+
+def collapse_duplicates(news_data):
+    # 各クラスタの最初の記事のみを代表として残す(入力の順序は維持する)
+    news_data = list(news_data)
+    seen = set()
+    representatives = []
+    for item, cluster_id in zip(news_data, cluster_ids(news_data)):
+        if cluster_id in seen:
+            continue
+        seen.add(cluster_id)
+        representatives.append(item)
+    return representatives
+
+# 動作確認 (ベンチマーク): 合成記事10万件をクラスタリングし、スループットを測る
+if __name__ == "__main__":
+    rng = np.random.RandomState(0)
+    alphabet = list("abcdefghijklmnopqrstuvwxyzあいうえおかきくけこさしすせそたちつてとなにぬねのAIモデル生成推論学習")
+    vocabulary = ["".join(rng.choice(alphabet, size=rng.randint(2, 8))) for _ in range(5000)]
+    n_articles = 100_000
+    n_topics = 70_000
+
+    topics = [" ".join(rng.choice(vocabulary, size=10)) for _ in range(n_topics)]
+    articles = []
+    for i in range(n_articles):
+        # 約3割は既存トピックの転載記事(サイトごとの文言が付く)とする
+        topic = topics[i] if i < n_topics else topics[rng.randint(n_topics)] + f" via site{rng.randint(5)}"
+        articles.append({"link": f"https://example.com/{i}", "title": topic, "summary": ""})
+
+    start = time.time()
+    ids = list(cluster_ids(articles))
+    elapsed = time.time() - start
+    print(f"{n_articles} 件を {elapsed:.2f} 秒でクラスタリングしました "
+          f"({n_articles / elapsed:.0f} 件/秒, クラスタ数: {len(set(ids))} / 期待値: {n_topics})")
+
+    # 実データ(PoCのラベル付き記事。転載記事を含まない)で、無関係な記事がまとめられないことを確認する
+    import os
+    import json
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../PoC/news_data_0404.json"),
+              encoding="utf-8") as f:
+        poc_articles = json.load(f)
+    print(f"PoCデータ: {len(poc_articles)} 件 → {len(collapse_duplicates(poc_articles))} 件")
@@ -0,0 +1,47 @@
+import os
+import zlib
+from datetime import datetime, timezone
+
+# GSI(published_datetime_bucket)のパーティションキー設計
+# 以前は category="AI_news" 固定をハッシュキーにしていたため、全書き込み・全クエリが1パーティションに集中していた。
+# カテゴリ + 日付バケット(UTC)をキーにし、必要に応じて書き込みシャードの接尾辞を付けて分散させる。
+#   例: "AI_news#20260405"  /  シャード数3の場合 "AI_news#20260405#2"
+BUCKET_ATTRIBUTE = "category_bucket"
+BUCKET_INDEX_NAME = "published_datetime_bucket"
+BUCKET_SECONDS = 24*60*60  # 1日単位のバケット
+# 書き込みシャード数。バッチとAPIで同じ値を使う必要がある
+WRITE_SHARDS = int(os.getenv("GSI_WRITE_SHARDS", "1"))
+
+
+def bucket_of(published_datetime):
+    return datetime.fromtimestamp(int(published_datetime), tz=timezone.utc).strftime("%Y%m%d")
+
+def shard_of(link, shards=None):
+    shards = WRITE_SHARDS if shards is None else shards
+    return zlib.crc32(str(link).encode("utf-8")) % shards
+
+def bucket_key(category, published_datetime, link="", shards=None):
+    shards = WRITE_SHARDS if shards is None else shards
+    key = f"{category}#{bucket_of(published_datetime)}"
+    if shards > 1:
+        key = f"{key}#{shard_of(link, shards)}"
+    return key
+
+def bucket_keys(category, start_time, end_time, shards=None):
+    # 期間[start_time, end_time]にかかる全バケット(×シャード)のキーを古い順に列挙する
+    shards = WRITE_SHARDS if shards is None else shards
+    keys = []
+    start = int(start_time) - int(start_time) % BUCKET_SECONDS
+    for bucket_start in range(start, int(end_time) + 1, BUCKET_SECONDS):
+        base = f"{category}#{bucket_of(bucket_start)}"
+        if shards > 1:
+            keys.extend(f"{base}#{shard}" for shard in range(shards))
+        else:
+            keys.append(base)
+    return keys
+
+def tag_buckets(items, shards=None):
+    # パイプラインのステージ: 各記事にGSI用のバケットキーを付与する
+    for item in items:
+        item[BUCKET_ATTRIBUTE] = bucket_key(item["category"], item["published_datetime"], item.get("link", ""), shards)
+        yield item
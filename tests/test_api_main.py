@@ -1,15 +1,40 @@
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
 import json
+import threading
+import time
 from fastapi.testclient import TestClient
-from app.api.main import app
+from app.api.main import app, response_cache, job_manager, news_store
+from app.api.article_store import ArticleStore
+from app.api import relevance
+from app.api import fulltext
+from app.api import summary_schema
+from app.api import bedrock_gateway
+from app.api import news_summary
+from app.api import prompt_eval
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from app.api.jobs import JobManager
 from app.api.get_dynamod_data import get_dynamo_data
 from app.api.news_summary import summarize_news_with_LLM
+from app.batch import partition
 
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    response_cache.clear()
+    job_manager.clear()
+    news_store.clear()
+    yield
+    response_cache.clear()
+    job_manager.clear()
+    news_store.clear()
+
+
 class TestApiHealthCheck:
     """Tests for API health check endpoint"""
     
@@ -28,49 +53,44 @@ class TestGetDynamoData:
     """Tests for get_dynamo_data function"""
     
     @patch("app.api.get_dynamod_data.boto3.client")
-    @patch("app.api.get_dynamod_data.boto3.resource")
-    def test_get_dynamo_data_success(self, mock_resource, mock_client):
+    def test_get_dynamo_data_success(self, mock_client):
         """Test successful data retrieval from DynamoDB"""
-        # Mock dynamodb resource
         mock_dynamodb = MagicMock()
-        mock_resource.return_value = mock_dynamodb
-        
-        mock_table = MagicMock()
-        mock_dynamodb.Table.return_value = mock_table
+        mock_client.return_value = mock_dynamodb
         
         mock_response = {
             'Items': [
                 {
-                    'id': '001',
-                    'title': 'Test News',
-                    'link': 'https://example.com',
-                    'published_datetime': 1234567890,
-                    'category': 'AI_news',
-                    'summary': 'Test summary'
+                    'id': {'S': '001'},
+                    'title': {'S': 'Test News'},
+                    'link': {'S': 'https://example.com'},
+                    'published_datetime': {'N': '1234567890'},
+                    'category': {'S': 'AI_news'},
+                    'summary': {'S': 'Test summary'}
                 }
             ]
         }
-        mock_table.query.return_value = mock_response
+        mock_dynamodb.query.return_value = mock_response
         
         result = get_dynamo_data(days=7, table_name='test-project')
         
         assert isinstance(result, list)
         assert len(result) == 1
         assert result[0]['title'] == 'Test News'
-        mock_table.query.assert_called_once()
+        assert result[0]['published_datetime'] == 1234567890
+        # 7日間の窓は8つの日付バケットにかかるため、バケットごとにクエリされる
+        assert mock_dynamodb.query.call_count == 8
+        assert mock_dynamodb.query.call_args[1]['IndexName'] == 'published_datetime_bucket'
+        assert mock_dynamodb.query.call_args[1]['TableName'] == 'test-project'
     
     @patch("app.api.get_dynamod_data.boto3.client")
-    @patch("app.api.get_dynamod_data.boto3.resource")
-    def test_get_dynamo_data_empty_result(self, mock_resource, mock_client):
+    def test_get_dynamo_data_empty_result(self, mock_client):
         """Test when no items are found in DynamoDB"""
         mock_dynamodb = MagicMock()
-        mock_resource.return_value = mock_dynamodb
-        
-        mock_table = MagicMock()
-        mock_dynamodb.Table.return_value = mock_table
+        mock_client.return_value = mock_dynamodb
         
         mock_response = {'Items': []}
-        mock_table.query.return_value = mock_response
+        mock_dynamodb.query.return_value = mock_response
         
         result = get_dynamo_data(days=7, table_name='test-project')
         
@@ -78,23 +98,19 @@ class TestGetDynamoData:
         assert len(result) == 0
     
     @patch("app.api.get_dynamod_data.boto3.client")
-    @patch("app.api.get_dynamod_data.boto3.resource")
-    def test_get_dynamo_data_multiple_items(self, mock_resource, mock_client):
+    def test_get_dynamo_data_multiple_items(self, mock_client):
         """Test retrieval of multiple items from DynamoDB"""
         mock_dynamodb = MagicMock()
-        mock_resource.return_value = mock_dynamodb
-        
-        mock_table = MagicMock()
-        mock_dynamodb.Table.return_value = mock_table
+        mock_client.return_value = mock_dynamodb
         
         mock_response = {
             'Items': [
-                {'id': '001', 'title': 'News 1', 'published_datetime': 1234567890},
-                {'id': '002', 'title': 'News 2', 'published_datetime': 1234567891},
-                {'id': '003', 'title': 'News 3', 'published_datetime': 1234567892}
+                {'id': {'S': '001'}, 'title': {'S': 'News 1'}, 'published_datetime': {'N': '1234567890'}},
+                {'id': {'S': '002'}, 'title': {'S': 'News 2'}, 'published_datetime': {'N': '1234567891'}},
+                {'id': {'S': '003'}, 'title': {'S': 'News 3'}, 'published_datetime': {'N': '1234567892'}}
             ]
         }
-        mock_table.query.return_value = mock_response
+        mock_dynamodb.query.return_value = mock_response
         
         result = get_dynamo_data(days=7, table_name='test-project')
         
@@ -103,32 +119,213 @@ class TestGetDynamoData:
         assert result[2]['title'] == 'News 3'
     
     @patch("app.api.get_dynamod_data.boto3.client")
-    @patch("app.api.get_dynamod_data.boto3.resource")
-    def test_get_dynamo_data_custom_days(self, mock_resource, mock_client):
-        """Test with custom days parameter"""
+    def test_get_dynamo_data_window_is_clamped_to_ttl(self, mock_client):
+        """Test that windows beyond the item TTL only query buckets that can still hold items"""
         mock_dynamodb = MagicMock()
-        mock_resource.return_value = mock_dynamodb
+        mock_client.return_value = mock_dynamodb
+        mock_dynamodb.query.return_value = {'Items': []}
         
-        mock_table = MagicMock()
-        mock_dynamodb.Table.return_value = mock_table
-        
-        mock_response = {'Items': []}
-        mock_table.query.return_value = mock_response
-        
-        result = get_dynamo_data(days=30, table_name='test-project')
+        result = get_dynamo_data(days=100000, table_name='test-project')
         
         assert isinstance(result, list)
-        mock_table.query.assert_called_once()
+        # 14日間のTTLに収めるため、15バケット分のみクエリし、clientは1つを共有する
+        assert mock_dynamodb.query.call_count == 15
+        assert mock_client.call_count == 1
     
-    @patch("app.api.get_dynamod_data.boto3.resource")
-    def test_get_dynamo_data_exception(self, mock_resource):
+    @patch("app.api.get_dynamod_data.boto3.client")
+    def test_get_dynamo_data_exception(self, mock_client):
         """Test exception handling in get_dynamo_data"""
-        mock_resource.side_effect = Exception("DynamoDB connection failed")
+        mock_client.side_effect = Exception("DynamoDB connection failed")
         
         with pytest.raises(Exception, match="DynamoDB connection failed"):
             get_dynamo_data(days=7, table_name='test-project')
 
 
+class TestBucketPartitioning:
+    """Tests for the time-bucketed GSI key scheme"""
+    
+    def test_bucket_key_uses_utc_day(self):
+        """Test that bucket keys combine category and UTC day"""
+        assert partition.bucket_key("AI_news", 1775347200, shards=1) == "AI_news#20260405"
+    
+    def test_bucket_key_with_write_shards(self):
+        """Test that write shards add a stable suffix"""
+        key = partition.bucket_key("AI_news", 1775347200, link="https://example.com/a", shards=4)
+        
+        assert key.startswith("AI_news#20260405#")
+        assert key == partition.bucket_key("AI_news", 1775347200, link="https://example.com/a", shards=4)
+    
+    def test_bucket_keys_cover_window(self):
+        """Test that every day bucket and shard in the window is enumerated"""
+        keys = partition.bucket_keys("AI_news", 1775347200 - 2*24*60*60, 1775347200, shards=2)
+        
+        assert len(keys) == 6
+        assert keys[0] == "AI_news#20260403#0"
+        assert keys[-1] == "AI_news#20260405#1"
+    
+    @patch("app.api.get_dynamod_data.boto3.client")
+    def test_get_dynamo_data_merges_buckets_by_time(self, mock_client):
+        """Test that per-bucket results are paginated and merged in time order"""
+        mock_dynamodb = MagicMock()
+        mock_client.return_value = mock_dynamodb
+        pages = {
+            "AI_news#20260404": [
+                {'Items': [{'link': {'S': 'a'}, 'published_datetime': {'N': '10'}}], 'LastEvaluatedKey': {'link': {'S': 'a'}}},
+                {'Items': [{'link': {'S': 'c'}, 'published_datetime': {'N': '30'}}]},
+            ],
+            "AI_news#20260405": [
+                {'Items': [{'link': {'S': 'b'}, 'published_datetime': {'N': '20'}}]},
+            ],
+        }
+        
+        def query(**kwargs):
+            bucket = kwargs['ExpressionAttributeValues'][':bucket']['S']
+            return pages.get(bucket, [{'Items': []}]).pop(0)
+        mock_dynamodb.query.side_effect = query
+        
+        with patch("app.api.get_dynamod_data.partition.bucket_keys", return_value=list(pages.keys())):
+            result = get_dynamo_data(days=1, table_name='test-project')
+        
+        assert [item['link'] for item in result] == ['a', 'b', 'c']
+
+
+class TestArticleStore:
+    """Tests for the in-process article store"""
+    
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_window_is_sliced_in_memory(self, mock_get_data):
+        """Test that N-day windows are answered from memory after warming"""
+        now = int(time.time())
+        mock_get_data.return_value = [
+            {'link': 'old', 'published_datetime': now - 10*24*60*60},
+            {'link': 'new', 'published_datetime': now - 1*24*60*60},
+            {'link': 'mid', 'published_datetime': now - 5*24*60*60},
+        ]
+        store = ArticleStore()
+        store.warm(table_name='test-table')
+        
+        assert [item['link'] for item in store.get_articles(days=3, table_name='test-table')] == ['new']
+        assert [item['link'] for item in store.get_articles(days=7, table_name='test-table')] == ['mid', 'new']
+        assert len(store.get_articles(days=14, table_name='test-table')) == 3
+        assert mock_get_data.call_count == 1
+    
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_refresh_queries_only_newer_items(self, mock_get_data):
+        """Test that refresh starts from the newest cached timestamp and deduplicates by link"""
+        now = int(time.time())
+        newest = now - 60
+        mock_get_data.return_value = [{'link': 'a', 'published_datetime': newest}]
+        store = ArticleStore(refresh_seconds=0)
+        store.warm(table_name='test-table')
+        
+        mock_get_data.return_value = [
+            {'link': 'a', 'published_datetime': newest},
+            {'link': 'b', 'published_datetime': now},
+        ]
+        result = store.get_articles(days=1, table_name='test-table')
+        
+        assert [item['link'] for item in result] == ['a', 'b']
+        assert mock_get_data.call_args[1]['start_time'] == newest - store.overlap_seconds
+    
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_failed_refresh_serves_cached_items(self, mock_get_data):
+        """Test that a failing incremental query falls back to the cache and is retried next time"""
+        now = int(time.time())
+        mock_get_data.return_value = [{'link': 'a', 'published_datetime': now - 60}]
+        store = ArticleStore(refresh_seconds=0)
+        store.warm(table_name='test-table')
+        
+        def throttled(**kwargs):
+            # クエリ中はロックを保持しない
+            assert not store._lock.locked()
+            raise Exception("ProvisionedThroughputExceededException")
+        mock_get_data.side_effect = throttled
+        
+        assert [item['link'] for item in store.get_articles(days=1, table_name='test-table')] == ['a']
+        assert [item['link'] for item in store.get_articles(days=1, table_name='test-table')] == ['a']
+        assert mock_get_data.call_count == 3
+    
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_failed_initial_load_raises(self, mock_get_data):
+        """Test that a failure without any cached items is reported to the caller"""
+        mock_get_data.side_effect = Exception("DynamoDB unavailable")
+        store = ArticleStore()
+        
+        with pytest.raises(Exception, match="DynamoDB unavailable"):
+            store.get_articles(days=1, table_name='test-table')
+    
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_concurrent_refresh_queries_once(self, mock_get_data):
+        """Test that only one request refreshes an expired table while the others answer from the cache"""
+        now = int(time.time())
+        mock_get_data.return_value = [{'link': 'a', 'published_datetime': now - 60}]
+        store = ArticleStore(refresh_seconds=0)
+        store.warm(table_name='test-table')
+        
+        started = threading.Event()
+        release = threading.Event()
+        def slow_query(**kwargs):
+            started.set()
+            release.wait(5)
+            return [{'link': 'b', 'published_datetime': now}]
+        mock_get_data.side_effect = slow_query
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            refreshing = executor.submit(store.get_articles, days=1, table_name='test-table')
+            started.wait(5)
+            others = [store.get_articles(days=1, table_name='test-table') for _ in range(5)]
+            release.set()
+            refreshed = refreshing.result()
+        
+        assert all([item['link'] for item in result] == ['a'] for result in others)
+        assert [item['link'] for item in refreshed] == ['a', 'b']
+        assert mock_get_data.call_count == 2
+
+
+class TestRelevancePrefilter:
+    """Tests for the local relevance prefilter"""
+    
+    def test_small_input_skips_scoring(self):
+        """Test that inputs within top-K are passed through without loading the model"""
+        news_data = [{'title': f'News {i}', 'link': f'https://example.com/{i}'} for i in range(3)]
+        
+        with patch("app.api.relevance.load_model") as mock_load:
+            result = relevance.prefilter_news(news_data, top_k=5)
+        
+        assert result == news_data
+        mock_load.assert_not_called()
+    
+    def test_top_k_keeps_original_order(self):
+        """Test that only the top-K scored articles are kept, in input order"""
+        news_data = [{'title': f'News {i}', 'link': f'https://example.com/{i}'} for i in range(5)]
+        
+        with patch("app.api.relevance.score_news", return_value=[0.1, 0.9, 0.3, 0.8, 0.2]):
+            result = relevance.prefilter_news(news_data, top_k=2)
+        
+        assert [item['link'] for item in result] == ['https://example.com/1', 'https://example.com/3']
+    
+    def test_threshold_drops_low_scores(self):
+        """Test that articles below the threshold are dropped"""
+        news_data = [{'title': f'News {i}'} for i in range(3)]
+        
+        with patch("app.api.relevance.score_news", return_value=[0.1, 0.9, 0.6]):
+            result = relevance.prefilter_news(news_data, top_k=10, threshold=0.5)
+        
+        assert [item['title'] for item in result] == ['News 1', 'News 2']
+    
+    def test_model_scores_labeled_data(self):
+        """Test that the model trained on PoC data ranks relevant articles above noise"""
+        with open(relevance.TRAINING_DATA_PATH, encoding="utf-8") as f:
+            labeled = json.load(f)
+        
+        scores = relevance.score_news(labeled)
+        relevant = [s for s, item in zip(scores, labeled) if item['correct_priority'] != 'Low']
+        noise = [s for s, item in zip(scores, labeled) if item['correct_priority'] == 'Low']
+        
+        assert len(scores) == len(labeled)
+        assert sum(relevant) / len(relevant) > sum(noise) / len(noise)
+
+
 class TestSummarizeNewsWithLLM:
     """Tests for summarize_news_with_LLM function"""
     
@@ -220,11 +417,338 @@ class TestSummarizeNewsWithLLM:
             summarize_news_with_LLM(test_news_data)
 
 
+class TestStructuredOutput:
+    """Tests for the tolerant JSON parser and schema repair"""
+    
+    def test_parse_strips_code_fences(self):
+        """Test that markdown code fences and surrounding text are ignored"""
+        text = '以下が結果です。\n```json\n[{"link": "a", "priority": "High"}]\n```'
+        
+        assert summary_schema.parse_llm_json(text) == [{"link": "a", "priority": "High"}]
+    
+    def test_parse_repairs_truncated_array(self):
+        """Test that a truncated array keeps its complete elements"""
+        text = '[{"link": "a", "priority": "High"}, {"link": "b", "reason": "途中で切'
+        
+        # 途中で切れた要素もリンクまでは残し、再判定の対象にできるようにする
+        assert summary_schema.parse_llm_json(text) == [{"link": "a", "priority": "High"}, {"link": "b"}]
+    
+    def test_parse_repairs_truncated_object(self):
+        """Test that a truncated object is closed after its last complete field"""
+        text = '[{"link": "a", "category": "Tech/Library", "priority": "Hi'
+        
+        assert summary_schema.parse_llm_json(text) == [{"link": "a", "category": "Tech/Library"}]
+    
+    def test_parse_without_json_raises(self):
+        """Test that output without any JSON raises ValueError"""
+        with pytest.raises(ValueError):
+            summary_schema.parse_llm_json("no json here")
+    
+    def test_validate_splits_valid_and_invalid(self):
+        """Test schema validation of judgements"""
+        items = {"items": [
+            {"link": "a", "category": "Tech/Library", "priority": "High", "reason": "r"},
+            {"link": "b", "category": "Biz/Trend", "priority": "Urgent", "reason": "r"},
+            {"link": "c", "category": "Carrer", "priority": "Medium", "reason": "r"},
+            {"link": "d", "category": "Career/Job", "priority": "Medium", "reason": "r"},
+        ]}
+        
+        valid, invalid = summary_schema.validate_judgements(items)
+        
+        assert [index for index, _ in valid] == [0, 2]
+        assert [index for index, _ in invalid] == [1, 3]
+    
+    @patch("app.api.news_summary.load_api_key")
+    @patch("builtins.open", new_callable=mock_open, read_data="Test prompt {news_data}")
+    @patch("app.api.news_summary.boto3.client")
+    def test_summarize_re_requests_only_invalid_items(self, mock_boto3_client, mock_file, mock_load_api):
+        """Test that only schema-invalid items are re-requested with a short follow-up call"""
+        mock_client = MagicMock()
+        mock_boto3_client.return_value = mock_client
+        
+        def tool_response(items):
+            return {'body': MagicMock(read=lambda: json.dumps({'content': [
+                {'type': 'tool_use', 'name': summary_schema.TOOL_NAME, 'input': {'items': items}}
+            ]}).encode())}
+        
+        mock_client.invoke_model.side_effect = [
+            tool_response([
+                {'link': 'https://example.com/1', 'category': 'Tech/Library', 'priority': 'High', 'reason': 'r1'},
+                {'link': 'https://example.com/2', 'category': 'Biz/Trend', 'priority': None, 'reason': 'r2'},
+            ]),
+            tool_response([
+                {'link': 'https://example.com/2', 'category': 'Biz/Trend', 'priority': 'Low', 'reason': 'r2'},
+            ]),
+        ]
+        news_data = [
+            {'title': 'OpenAI releases a new reasoning model', 'link': 'https://example.com/1'},
+            {'title': 'Google Cloud announces BigQuery updates', 'link': 'https://example.com/2'},
+        ]
+        
+        result = json.loads(summarize_news_with_LLM(news_data))
+        
+        assert [item['priority'] for item in result] == ['High', 'Low']
+        assert mock_client.invoke_model.call_count == 2
+        retry_body = json.loads(mock_client.invoke_model.call_args_list[1][1]['body'])
+        assert 'https://example.com/1' not in retry_body['messages'][0]['content']
+        assert 'https://example.com/2' in retry_body['messages'][0]['content']
+        # 再判定もメインの判定と同じモデルで行う
+        models = [call[1]['modelId'] for call in mock_client.invoke_model.call_args_list]
+        assert models == [bedrock_gateway.BEDROCK_MODEL_ID] * 2
+    
+    @patch("app.api.news_summary.load_api_key")
+    @patch("builtins.open", new_callable=mock_open, read_data="Test prompt {news_data}")
+    @patch("app.api.news_summary.boto3.client")
+    def test_summarize_re_requests_articles_missing_from_truncated_output(self, mock_boto3_client, mock_file, mock_load_api):
+        """Test that articles the model never reached (max_tokens) are judged in the follow-up call"""
+        mock_client = MagicMock()
+        mock_boto3_client.return_value = mock_client
+        
+        def tool_response(items, stop_reason="tool_use"):
+            return {'body': MagicMock(read=lambda: json.dumps({'stop_reason': stop_reason, 'content': [
+                {'type': 'tool_use', 'name': summary_schema.TOOL_NAME, 'input': {'items': items}}
+            ]}).encode())}
+        
+        mock_client.invoke_model.side_effect = [
+            tool_response([
+                {'link': 'https://example.com/1', 'category': 'Tech/Library', 'priority': 'High', 'reason': 'r1'},
+            ], stop_reason="max_tokens"),
+            tool_response([
+                {'link': 'https://example.com/2', 'category': 'Biz/Trend', 'priority': 'Low', 'reason': 'r2'},
+                {'link': 'https://example.com/3', 'category': 'Other/Noise', 'priority': 'Low', 'reason': 'r3'},
+            ]),
+        ]
+        news_data = [
+            {'title': 'OpenAI releases a new reasoning model', 'link': 'https://example.com/1'},
+            {'title': 'Google Cloud announces BigQuery updates', 'link': 'https://example.com/2'},
+            {'title': 'Local meetup announcement', 'link': 'https://example.com/3'},
+        ]
+        
+        result = json.loads(summarize_news_with_LLM(news_data))
+        
+        assert [item['link'] for item in result] == ['https://example.com/1', 'https://example.com/2', 'https://example.com/3']
+        assert mock_client.invoke_model.call_count == 2
+        retry_body = json.loads(mock_client.invoke_model.call_args_list[1][1]['body'])
+        assert 'https://example.com/1' not in retry_body['messages'][0]['content']
+        assert 'https://example.com/3' in retry_body['messages'][0]['content']
+    
+    @pytest.mark.parametrize("tool_input", [{}, {'items': 'not a list'}])
+    @patch("app.api.news_summary.load_api_key")
+    @patch("builtins.open", new_callable=mock_open, read_data="Test prompt {news_data}")
+    @patch("app.api.news_summary.boto3.client")
+    def test_summarize_without_valid_items_raises(self, mock_boto3_client, mock_file, mock_load_api, tool_input):
+        """Test that an output with no usable judgement raises instead of returning an empty list"""
+        mock_client = MagicMock()
+        mock_boto3_client.return_value = mock_client
+        mock_client.invoke_model.return_value = {'body': MagicMock(read=lambda: json.dumps({'content': [
+            {'type': 'tool_use', 'name': summary_schema.TOOL_NAME, 'input': tool_input}
+        ]}).encode())}
+        news_data = [{'title': 'OpenAI releases a new reasoning model', 'link': 'https://example.com/1'}]
+        
+        with pytest.raises(ValueError):
+            summarize_news_with_LLM(news_data)
+
+
+class FakeBedrock:
+    """Fake bedrock-runtime client that throttles above a concurrency quota"""
+    
+    def __init__(self, quota, latency=0.01):
+        self.quota = quota
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled = 0
+        self.succeeded = 0
+        self.models = []
+        self._lock = threading.Lock()
+    
+    def invoke_model(self, modelId, body):
+        with self._lock:
+            self.models.append(modelId)
+            if self.in_flight >= self.quota:
+                self.throttled += 1
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.succeeded += 1
+        return {"body": MagicMock()}
+
+
+class TestBedrockGateway:
+    """Tests for the Bedrock gateway against a throttling fake"""
+    
+    BODY = json.dumps({"messages": [{"role": "user", "content": "test"}], "max_tokens": 10})
+    
+    def test_all_requests_succeed_under_throttling(self):
+        """Test that throttled calls are retried and concurrency backs off"""
+        fake = FakeBedrock(quota=2)
+        limiter = bedrock_gateway.AIMDLimiter(initial=8)
+        gateway = bedrock_gateway.BedrockGateway(limiter=limiter, max_retries=50, base_delay=0.001, max_delay=0.01)
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: gateway.invoke(fake, self.BODY), range(40)))
+        
+        assert fake.succeeded == 40
+        assert fake.throttled > 0
+        assert limiter.limit < 8
+        assert limiter.in_flight == 0
+    
+    def test_non_throttling_error_is_not_retried(self):
+        """Test that other errors propagate immediately"""
+        client = MagicMock()
+        client.invoke_model.side_effect = ClientError({"Error": {"Code": "ValidationException"}}, "InvokeModel")
+        gateway = bedrock_gateway.BedrockGateway(sleep=lambda _: None)
+        
+        with pytest.raises(ClientError):
+            gateway.invoke(client, self.BODY)
+        
+        assert client.invoke_model.call_count == 1
+    
+    def test_transient_errors_are_retried_without_backing_off_concurrency(self):
+        """Test that connection errors and 5xx model errors are retried like before"""
+        client = MagicMock()
+        client.invoke_model.side_effect = [
+            EndpointConnectionError(endpoint_url="https://bedrock-runtime"),
+            ReadTimeoutError(endpoint_url="https://bedrock-runtime"),
+            ClientError({"Error": {"Code": "InternalServerException"}}, "InvokeModel"),
+            ClientError({"Error": {"Code": "ModelTimeoutException"}}, "InvokeModel"),
+            {"body": "ok"},
+        ]
+        limiter = bedrock_gateway.AIMDLimiter(initial=4)
+        gateway = bedrock_gateway.BedrockGateway(limiter=limiter, sleep=lambda _: None)
+        
+        assert gateway.invoke(client, self.BODY) == {"body": "ok"}
+        assert client.invoke_model.call_count == 5
+        assert limiter.limit >= 4
+    
+    def test_gives_up_after_max_retries(self):
+        """Test that persistent throttling raises after max retries"""
+        client = MagicMock()
+        client.invoke_model.side_effect = ClientError({"Error": {"Code": "ThrottlingException"}}, "InvokeModel")
+        gateway = bedrock_gateway.BedrockGateway(max_retries=3, sleep=lambda _: None)
+        
+        with pytest.raises(ClientError):
+            gateway.invoke(client, self.BODY)
+        
+        assert client.invoke_model.call_count == 4
+    
+    def test_model_override(self):
+        """Test that the configured model is used unless a call overrides it"""
+        fake = FakeBedrock(quota=10, latency=0)
+        gateway = bedrock_gateway.BedrockGateway(model_id="default-model")
+        
+        gateway.invoke(fake, self.BODY)
+        gateway.invoke(fake, self.BODY, model_id="other-model")
+        
+        assert fake.models == ["default-model", "other-model"]
+    
+    def test_token_budget_waits_when_exhausted(self):
+        """Test that the token budget sleeps until enough tokens are refilled"""
+        now = [0.0]
+        waits = []
+        
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+        
+        budget = bedrock_gateway.TokenBudget(tokens_per_minute=600, clock=lambda: now[0], sleep=sleep)
+        budget.consume(600)
+        budget.consume(100)
+        
+        assert waits == [pytest.approx(10.0)]
+
+
+class TestPromptCaching:
+    """Tests for Bedrock prompt-prefix caching"""
+    
+    PROMPT = "指示: 入力された `{news_data}` をすべて判定する {{\"link\": \"URL\"}}\n## データ：\n{news_data}"
+    CACHING_MODEL = "us.anthropic.claude-3-7-sonnet-20250219-v1:0"
+    
+    def _invoke(self, mock_boto3_client, usage=None):
+        mock_client = MagicMock()
+        mock_boto3_client.return_value = mock_client
+        mock_client.invoke_model.return_value = {
+            'body': MagicMock(read=lambda: json.dumps({'content': [{'text': '[]'}], 'usage': usage or {}}).encode())
+        }
+        return mock_client
+    
+    @patch("app.api.news_summary.PROMPT_CACHING_ENABLED", False)
+    @patch("app.api.news_summary.boto3.client")
+    def test_caching_disabled_keeps_single_user_message(self, mock_boto3_client):
+        """Test that the request body is unchanged when caching is off"""
+        mock_client = self._invoke(mock_boto3_client)
+        
+        news_summary.create_response(self.PROMPT, [{'title': 'A'}])
+        
+        body = json.loads(mock_client.invoke_model.call_args[1]['body'])
+        assert "system" not in body
+        assert body['messages'][0]['content'].count("{'title': 'A'}") == 2
+    
+    @patch("app.api.news_summary.PROMPT_CACHING_ENABLED", True)
+    @patch("app.api.news_summary.boto3.client")
+    def test_caching_enabled_splits_static_prefix(self, mock_boto3_client):
+        """Test that static instructions go to a cached system block and only data to the user message"""
+        mock_client = self._invoke(mock_boto3_client)
+        
+        news_summary.create_response(self.PROMPT, [{'title': 'A'}], model_id=self.CACHING_MODEL)
+        news_summary.create_response(self.PROMPT, [{'title': 'B'}], model_id=self.CACHING_MODEL)
+        
+        first, second = [json.loads(call[1]['body']) for call in mock_client.invoke_model.call_args_list]
+        assert first['system'] == second['system']
+        assert first['system'][0]['cache_control'] == {"type": "ephemeral"}
+        assert "'title'" not in first['system'][0]['text']
+        assert '{"link": "URL"}' in first['system'][0]['text']
+        assert first['messages'][0]['content'] == "[{'title': 'A'}]"
+    
+    @patch("app.api.news_summary.PROMPT_CACHING_ENABLED", True)
+    @patch("app.api.news_summary.boto3.client")
+    def test_caching_skipped_for_unsupported_model(self, mock_boto3_client):
+        """Test that models without prompt caching get the plain request body"""
+        mock_client = self._invoke(mock_boto3_client)
+        
+        news_summary.create_response(self.PROMPT, [{'title': 'A'}], model_id="anthropic.claude-3-5-sonnet-20240620-v1:0")
+        
+        body = json.loads(mock_client.invoke_model.call_args[1]['body'])
+        assert "system" not in body
+    
+    def test_token_estimate_counts_system_and_tools(self):
+        """Test that the token budget sees the cached system block and tool schema"""
+        messages_only = json.dumps({"messages": [{"role": "user", "content": "data"}], "max_tokens": 0})
+        with_system = json.dumps({"system": [{"type": "text", "text": "指示" * 3000}],
+                                  "tools": [summary_schema.TOOL_DEFINITION],
+                                  "messages": [{"role": "user", "content": "data"}], "max_tokens": 0})
+        
+        assert bedrock_gateway.estimate_tokens(with_system) > bedrock_gateway.estimate_tokens(messages_only) + 2000
+    
+    def test_usage_endpoint_reports_totals(self):
+        """Test that accumulated usage is exposed on /usage"""
+        response = client.get("/usage")
+        
+        assert response.status_code == 200
+        assert response.json() == news_summary.usage_snapshot()
+    
+    def test_usage_records_cache_tokens(self):
+        """Test that cache read/write token counts are accumulated from the response usage"""
+        before = dict(news_summary.usage_stats)
+        response = {'body': MagicMock(read=lambda: json.dumps({
+            'content': [], 'usage': {'input_tokens': 10, 'output_tokens': 5,
+                                     'cache_read_input_tokens': 2000, 'cache_creation_input_tokens': 0}
+        }).encode())}
+        
+        news_summary.read_response_body(response)
+        
+        assert news_summary.usage_stats['cache_read_input_tokens'] - before['cache_read_input_tokens'] == 2000
+        assert news_summary.usage_stats['input_tokens'] - before['input_tokens'] == 10
+
+
 class TestPredictEndpoint:
     """Tests for /predict endpoint"""
     
     @patch("app.api.main.news_summary.summarize_news_with_LLM")
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_predict_endpoint_success(self, mock_get_data, mock_summarize):
         """Test successful prediction endpoint"""
         mock_get_data.return_value = [
@@ -243,18 +767,18 @@ class TestPredictEndpoint:
         mock_summarize.assert_called_once()
     
     @patch("app.api.main.news_summary.summarize_news_with_LLM")
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_predict_endpoint_with_custom_days(self, mock_get_data, mock_summarize):
         """Test prediction endpoint with custom days parameter"""
         mock_get_data.return_value = []
         mock_summarize.return_value = '{"result": "no data"}'
         
-        response = client.get("/predict?days=30")
+        response = client.get("/predict?days=10")
         
         assert response.status_code == 200
         mock_get_data.assert_called_once()
     
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_predict_endpoint_get_data_exception(self, mock_get_data):
         """Test error handling when data retrieval fails"""
         mock_get_data.side_effect = Exception("Database error")
@@ -267,7 +791,7 @@ class TestPredictEndpoint:
         assert "Database error" in data["error"]
     
     @patch("app.api.main.news_summary.summarize_news_with_LLM")
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_predict_endpoint_summarize_exception(self, mock_get_data, mock_summarize):
         """Test error handling when summarization fails"""
         mock_get_data.return_value = [{'title': 'Test', 'link': 'https://example.com'}]
@@ -281,7 +805,7 @@ class TestPredictEndpoint:
         assert "LLM error" in data["error"]
     
     @patch("app.api.main.news_summary.summarize_news_with_LLM")
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_predict_endpoint_with_table_name_param(self, mock_get_data, mock_summarize):
         """Test prediction endpoint with custom table name"""
         mock_get_data.return_value = []
@@ -298,7 +822,7 @@ class TestNewsDataIntegration:
     """Integration tests for news data flow through API"""
     
     @patch("app.api.main.news_summary.summarize_news_with_LLM")
-    @patch("app.api.main.get_dynamod_data.get_dynamo_data")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
     def test_full_api_pipeline(self, mock_get_data, mock_summarize):
         """Test complete API pipeline from data retrieval to summarization"""
         # Mock data from DynamoDB
@@ -307,7 +831,7 @@ class TestNewsDataIntegration:
                 'id': '20260205101',
                 'title': 'OpenAI Announcement',
                 'link': 'https://openai.com/news',
-                'published_datetime': 1770217200,
+                'published_datetime': int(time.time()) - 2*24*60*60,
                 'category': 'AI_news',
                 'summary': 'New AI model released'
             },
@@ -315,7 +839,7 @@ class TestNewsDataIntegration:
                 'id': '20260205102',
                 'title': 'Google AI Update',
                 'link': 'https://google.com/ai',
-                'published_datetime': 1770217201,
+                'published_datetime': int(time.time()) - 2*24*60*60 + 1,
                 'category': 'AI_news',
                 'summary': 'Gemini update announced'
             }
@@ -347,3 +871,395 @@ class TestNewsDataIntegration:
         summarize_call_args = mock_summarize.call_args[0][0]
         assert len(summarize_call_args) == 2
         assert summarize_call_args[0]['title'] == 'OpenAI Announcement'
+
+
+class TestPredictCaching:
+    """Tests for ETag / compression handling on /predict"""
+    
+    NEWS = [
+        {'title': 'Test News', 'link': 'https://example.com/a', 'published_datetime': 1234567890}
+    ]
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_returns_etag(self, mock_get_data, mock_summarize):
+        """Test that /predict returns a strong ETag"""
+        mock_get_data.return_value = self.NEWS
+        mock_summarize.return_value = '{"result": "success"}'
+        
+        response = client.get("/predict")
+        
+        assert response.status_code == 200
+        assert response.headers["etag"].startswith('"')
+        assert response.json() == {"result": "success"}
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_if_none_match_skips_dynamodb_and_llm(self, mock_get_data, mock_summarize):
+        """Test that a matching If-None-Match returns 304 without DynamoDB or LLM calls"""
+        mock_get_data.return_value = self.NEWS
+        mock_summarize.return_value = '{"result": "success"}'
+        etag = client.get("/predict").headers["etag"]
+        
+        response = client.get("/predict", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 304
+        assert mock_get_data.call_count == 1
+        assert mock_summarize.call_count == 1
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_same_articles_reuse_summary(self, mock_get_data, mock_summarize):
+        """Test that an unchanged article set reuses the cached body without another LLM call"""
+        mock_get_data.return_value = self.NEWS
+        mock_summarize.return_value = '{"result": "success"}'
+        
+        first = client.get("/predict")
+        response_cache._etags.clear()
+        second = client.get("/predict")
+        
+        assert first.headers["etag"] == second.headers["etag"]
+        assert second.json() == {"result": "success"}
+        assert mock_get_data.call_count == 1
+        assert mock_summarize.call_count == 1
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_compresses_large_body(self, mock_get_data, mock_summarize):
+        """Test that bodies above the threshold are gzip compressed"""
+        mock_get_data.return_value = self.NEWS
+        mock_summarize.return_value = json.dumps([{"reason": "x" * 100, "link": f"https://example.com/{i}"} for i in range(50)])
+        
+        response = client.get("/predict", headers={"Accept-Encoding": "gzip"})
+        
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 50
+
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_etag_differs_per_encoding(self, mock_get_data, mock_summarize):
+        """Test that compressed and identity representations get distinct strong ETags"""
+        mock_get_data.return_value = self.NEWS
+        mock_summarize.return_value = json.dumps([{"reason": "x" * 100, "link": f"https://example.com/{i}"} for i in range(50)])
+
+        gzipped = client.get("/predict", headers={"Accept-Encoding": "gzip"})
+        identity = client.get("/predict", headers={"Accept-Encoding": "identity"})
+
+        assert gzipped.headers["etag"].endswith('-gzip"')
+        assert identity.headers["etag"] != gzipped.headers["etag"]
+
+        response = client.get("/predict", headers={"Accept-Encoding": "gzip",
+                                                   "If-None-Match": gzipped.headers["etag"]})
+        assert response.status_code == 304
+        assert response.headers["etag"] == gzipped.headers["etag"]
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert mock_summarize.call_count == 1
+
+
+class TestJobsEndpoint:
+    """Tests for the background /jobs API"""
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_create_and_poll_job(self, mock_get_data, mock_summarize):
+        """Test that POST /jobs returns an ID and GET /jobs/{id} returns the result"""
+        mock_get_data.return_value = [{'title': 'Test', 'link': 'https://example.com'}]
+        mock_summarize.return_value = '[{"link": "https://example.com", "priority": "High"}]'
+        
+        response = client.post("/jobs?days=3")
+        
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        job_manager.wait(job_id, timeout=5)
+        
+        result = client.get(f"/jobs/{job_id}")
+        assert result.status_code == 200
+        data = result.json()
+        assert data["status"] == "succeeded"
+        assert data["result"][0]["priority"] == "High"
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_failed_job_reports_error(self, mock_get_data, mock_summarize):
+        """Test that a failing job exposes its error"""
+        mock_get_data.side_effect = Exception("Database error")
+        
+        job_id = client.post("/jobs").json()["job_id"]
+        job_manager.wait(job_id, timeout=5)
+        
+        data = client.get(f"/jobs/{job_id}").json()
+        assert data["status"] == "failed"
+        assert "Database error" in data["error"]
+    
+    def test_unknown_job_returns_404(self):
+        """Test polling an unknown job ID"""
+        response = client.get("/jobs/unknown")
+        
+        assert response.status_code == 404
+        assert "error" in response.json()
+
+
+class TestJobManager:
+    """Tests for JobManager deduplication and TTL"""
+    
+    def test_same_key_is_deduplicated(self):
+        """Test that jobs with the same parameters share one job"""
+        manager = JobManager(max_workers=1)
+        release = threading.Event()
+        calls = []
+        
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return "done"
+        
+        first = manager.submit(("7", "ai_news"), work)
+        second = manager.submit(("7", "ai_news"), work)
+        release.set()
+        manager.wait(first["job_id"], timeout=5)
+        
+        assert first["job_id"] == second["job_id"]
+        assert len(calls) == 1
+        assert manager.get(first["job_id"])["result"] == "done"
+        manager.shutdown()
+    
+    def test_finished_job_expires_after_ttl(self):
+        """Test that finished results are dropped after the TTL"""
+        manager = JobManager(max_workers=1, result_ttl=0)
+        job = manager.submit(("7", "ai_news"), lambda: "done")
+        manager.wait(job["job_id"], timeout=5)
+        time.sleep(0.01)
+        
+        assert manager.get(job["job_id"]) is None
+        manager.shutdown()
+
+
+FIXTURE_PAGES = {
+    "/robots.txt": "User-agent: *\nDisallow: /private/\n",
+    "/article": """<html><head><script>var x = 1;</script></head><body>
+        <nav>メニュー</nav>
+        <article><h1>新モデルの発表</h1><p>推論性能が大幅に向上しました。</p></article>
+        <footer>Copyright</footer></body></html>""",
+    "/private/secret": "<html><body><p>secret</p></body></html>",
+    "/no-charset": """<html><head><meta charset="utf-8"></head><body>
+        <article><p>日本語の本文です。</p></article></body></html>""",
+}
+# Content-Typeにcharsetを付けずに返すページ
+FIXTURE_CONTENT_TYPES = {"/no-charset": "text/html"}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+    
+    def do_GET(self):
+        FixtureHandler.requests_seen.append(self.path)
+        page = FIXTURE_PAGES.get(self.path)
+        if page is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = page.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", FIXTURE_CONTENT_TYPES.get(self.path, "text/html; charset=utf-8"))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_server():
+    FixtureHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestFullTextFetcher:
+    """Tests for the concurrent full-text fetcher against a local HTTP server"""
+    
+    def test_extract_main_text_prefers_article(self):
+        """Test that scripts and navigation are dropped"""
+        text = fulltext.extract_main_text(FIXTURE_PAGES["/article"])
+        
+        assert "推論性能が大幅に向上しました。" in text
+        assert "メニュー" not in text
+        assert "var x" not in text
+    
+    def test_fetch_all_uses_cache_and_robots(self, fixture_server, tmp_path):
+        """Test that pages are fetched once, cached, and robots.txt is respected"""
+        fetcher = fulltext.FullTextFetcher(cache=fulltext.ContentCache(str(tmp_path)), host_interval=0)
+        urls = [f"{fixture_server}/article", f"{fixture_server}/private/secret", f"{fixture_server}/missing"]
+        
+        result = fetcher.fetch_all(urls)
+        
+        assert "新モデルの発表" in result[urls[0]]
+        assert result[urls[1]] is None
+        assert result[urls[2]] is None
+        assert "/private/secret" not in FixtureHandler.requests_seen
+        
+        # 新しいフェッチャーでもディスクのキャッシュから返され、再取得しない
+        fetcher = fulltext.FullTextFetcher(cache=fulltext.ContentCache(str(tmp_path)), host_interval=0)
+        assert fetcher.fetch(urls[0]) == result[urls[0]]
+        assert FixtureHandler.requests_seen.count("/article") == 1
+    
+    def test_robots_txt_is_fetched_once_per_origin(self, fixture_server, tmp_path):
+        """Test that concurrent first fetches on one host share a single robots.txt request"""
+        fetcher = fulltext.FullTextFetcher(cache=fulltext.ContentCache(str(tmp_path)), host_interval=0)
+        
+        fetcher.fetch_all(f"{fixture_server}/article?{i}" for i in range(8))
+        
+        assert FixtureHandler.requests_seen.count("/robots.txt") == 1
+    
+    def test_fetch_detects_charset_without_content_type_charset(self, fixture_server, tmp_path):
+        """Test that UTF-8 pages served without a charset header are not decoded as ISO-8859-1"""
+        fetcher = fulltext.FullTextFetcher(cache=fulltext.ContentCache(str(tmp_path)), host_interval=0)
+        
+        assert "日本語の本文です。" in fetcher.fetch(f"{fixture_server}/no-charset")
+    
+    def test_attach_full_text_only_for_high_priority(self, fixture_server, tmp_path):
+        """Test that only High priority items get the full text"""
+        fetcher = fulltext.FullTextFetcher(cache=fulltext.ContentCache(str(tmp_path)), host_interval=0)
+        items = [
+            {"link": f"{fixture_server}/article", "priority": "High"},
+            {"link": f"{fixture_server}/article?low", "priority": "Low"},
+        ]
+        
+        fulltext.attach_full_text(items, fetcher)
+        
+        assert "新モデルの発表" in items[0]["full_text"]
+        assert "full_text" not in items[1]
+
+
+class TestTopicFilter:
+    """Tests for /predict?topic=..."""
+    
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_predict_topic_sends_only_relevant_articles(self, mock_get_data, mock_summarize):
+        """Test that only articles similar to the topic are summarized"""
+        now = int(time.time())
+        mock_get_data.return_value = [
+            {'link': 'a', 'title': 'RAGの検索精度を上げる工夫', 'summary': 'RAG retrieval', 'published_datetime': now - 60},
+            {'link': 'b', 'title': 'GPUクラスタの電力効率', 'summary': 'データセンター', 'published_datetime': now - 50},
+        ]
+        mock_summarize.return_value = '[]'
+        
+        response = client.get("/predict?topic=RAG&top_k=1")
+        
+        assert response.status_code == 200
+        assert [item['link'] for item in mock_summarize.call_args[0][0]] == ['a']
+    
+    @pytest.mark.parametrize("query", ["top_k=abc", "top_k=-1", "top_k=0", "days=abc", "days=0", "days=15"])
+    @patch("app.api.main.news_summary.summarize_news_with_LLM")
+    @patch("app.api.article_store.get_dynamod_data.get_dynamo_data")
+    def test_invalid_query_parameters_return_422(self, mock_get_data, mock_summarize, query):
+        """Test that non-numeric, non-positive or beyond-TTL days/top_k are rejected before any work"""
+        predict = client.get(f"/predict?topic=RAG&{query}")
+        job = client.post(f"/jobs?topic=RAG&{query}")
+        
+        assert predict.status_code == 422
+        assert job.status_code == 422
+        mock_get_data.assert_not_called()
+        mock_summarize.assert_not_called()
+
+
+class TestPromptEval:
+    """Tests for the offline prompt evaluation harness"""
+    
+    NEWS = [
+        {'link': 'https://example.com/1', 'title': 'OpenAI releases a reasoning model', 'summary': 'new model', 'correct_priority': 'High'},
+        {'link': 'https://example.com/2', 'title': 'SEO ranking update for site owners', 'summary': 'search', 'correct_priority': 'Low'},
+    ]
+    
+    def test_fake_backend_variants_run_in_parallel(self):
+        """Test that every prompt/model variant is measured with the fake backend"""
+        baseline = prompt_eval.load_baseline(self.NEWS)
+        
+        results = prompt_eval.run_evaluation(
+            self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], ["model-a", "model-b"],
+            prompt_eval.FakeBedrockClient(), baseline)
+        
+        assert [result["model"] for result in results] == ["model-a", "model-b"]
+        for result in results:
+            assert result["json_valid"] is True
+            assert result["calls"] == 1
+            assert result["input_tokens"] > 0
+            assert result["judged"] == 2
+            assert result["priority_agreement"] == 0.5
+            assert result["category_agreement"] is None
+        assert "priority_agreement" in prompt_eval.format_table(results)
+    
+    def test_local_backends_bypass_the_shared_token_budget(self):
+        """Test that fake variants run on their own gateway and report backend latency only"""
+        with open(prompt_eval.DEFAULT_DATA_PATH, encoding="utf-8") as f:
+            news_data = json.load(f)
+        
+        with patch.object(bedrock_gateway.default_gateway, "budget") as shared_budget:
+            results = prompt_eval.run_evaluation(news_data, [prompt_eval.DEFAULT_PROMPT_PATH], ["a", "b", "c", "d"],
+                                                 prompt_eval.FakeBedrockClient(), prompt_eval.load_baseline(news_data))
+        
+        shared_budget.consume.assert_not_called()
+        assert all(result["error"] is None and result["latency"] < 1 for result in results)
+    
+    def test_labels_are_not_sent_to_the_model(self):
+        """Test that correct_priority never reaches the prompt"""
+        backend = MagicMock(wraps=prompt_eval.FakeBedrockClient())
+        
+        prompt_eval.run_evaluation(self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], [None], backend, {})
+        
+        assert "correct_priority" not in backend.invoke_model.call_args[1]["body"]
+    
+    def test_preselection_is_an_explicit_axis(self):
+        """Test that dedup/prefilter are bypassed by default and the sent count is reported"""
+        with open(prompt_eval.DEFAULT_DATA_PATH, encoding="utf-8") as f:
+            news_data = json.load(f)
+        
+        off, on = prompt_eval.run_evaluation(news_data, [prompt_eval.DEFAULT_PROMPT_PATH], [None],
+                                             prompt_eval.FakeBedrockClient(), prompt_eval.load_baseline(news_data),
+                                             preselect_modes=(False, True))
+        
+        assert (off["preselect"], off["articles"], off["sent"], off["judged"]) == (False, 80, 80, 80)
+        assert (on["preselect"], on["articles"], on["sent"]) == (True, 80, relevance.RELEVANCE_TOP_K)
+        assert on["judged"] == on["sent"]
+    
+    def test_json_valid_reflects_raw_output_before_repair(self):
+        """Test that output needing local repair is not counted as valid JSON"""
+        backend = MagicMock()
+        backend.invoke_model.return_value = {"body": MagicMock(read=lambda: json.dumps({"content": [{"type": "text", "text":
+            '```json\n[{"link": "https://example.com/1", "category": "Tech/Library", "priority": "High", "reason": "r"}]\n```'
+        }]}).encode())}
+        
+        result = prompt_eval.run_evaluation(self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], ["m"], backend,
+                                            prompt_eval.load_baseline(self.NEWS))[0]
+        
+        assert result["json_valid"] is False
+        assert result["judged"] == 1
+    
+    def test_recorded_backend_replays_responses(self, tmp_path):
+        """Test that responses recorded from one backend replay offline"""
+        recording = str(tmp_path / "recording.json")
+        recorder = prompt_eval.RecordingClient(recording, inner=prompt_eval.FakeBedrockClient())
+        first = prompt_eval.run_evaluation(self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], ["m"], recorder, {})
+        recorder.save()
+        
+        replay = prompt_eval.RecordingClient(recording)
+        second = prompt_eval.run_evaluation(self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], ["m"], replay, {})
+        
+        assert second[0]["judgements"] == first[0]["judgements"]
+        assert second[0]["input_tokens"] == first[0]["input_tokens"]
+    
+    def test_missing_recording_is_reported(self, tmp_path):
+        """Test that a replay miss is reported as an error instead of calling Bedrock"""
+        replay = prompt_eval.RecordingClient(str(tmp_path / "missing.json"))
+        
+        result = prompt_eval.run_evaluation(self.NEWS, [prompt_eval.DEFAULT_PROMPT_PATH], ["m"], replay, {})[0]
+        
+        assert result["json_valid"] is False
+        assert "記録されていないリクエスト" in result["error"]
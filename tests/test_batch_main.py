@@ -1,10 +1,14 @@
 import pytest
 from unittest.mock import patch, MagicMock, mock_open
+import os
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from app.batch.get_news import get_news
-from app.batch.dynamo_write import dynamo_batch_write
+from app.batch.get_news import get_news, iter_news, dedup_items
+from app.batch.dynamo_write import dynamo_batch_write, dynamo_stream_write
+from app.batch import near_dup
+from app.batch import embedding
 
 
 class TestGetNews:
@@ -169,6 +173,158 @@ class TestDynamoBatchWrite:
         mock_batch_writer.put_item.assert_not_called()
 
 
+class TestStreamingPipeline:
+    """Tests for the generator based fetch → parse → clean → dedup → write pipeline"""
+    
+    @patch("app.batch.get_news.feedparser.parse")
+    def test_iter_news_is_lazy(self, mock_parse):
+        """Test that feeds are fetched only when items are pulled"""
+        mock_entry = MagicMock()
+        mock_entry.title = "Article"
+        mock_entry.link = "https://example.com/article"
+        mock_entry.summary = "<p>Summary</p>"
+        mock_entry.published_parsed = (2024, 1, 15, 10, 30, 45, 0, 0, 0)
+        mock_parse.return_value = MagicMock(entries=[mock_entry])
+        
+        items = iter_news(["https://feed1.com/rss", "https://feed2.com/rss"])
+        assert mock_parse.call_count == 0
+        
+        first = next(items)
+        assert mock_parse.call_count == 1
+        assert first["summary"] == "Summary"
+        assert first["link"] == "https://example.com/article"
+    
+    def test_dedup_items_skips_same_link(self):
+        """Test that items with an already seen link are dropped"""
+        items = [
+            {"id": "1", "link": "https://example.com/a"},
+            {"id": "2", "link": "https://example.com/b"},
+            {"id": "3", "link": "https://example.com/a"},
+        ]
+        
+        result = list(dedup_items(iter(items)))
+        
+        assert [item["id"] for item in result] == ["1", "2"]
+
+    def test_dedup_items_window_bounds_seen_links(self):
+        """Test that only the most recent links are remembered"""
+        items = [
+            {"id": "1", "link": "https://example.com/a"},
+            {"id": "2", "link": "https://example.com/b"},
+            {"id": "3", "link": "https://example.com/c"},
+            {"id": "4", "link": "https://example.com/c"},
+            {"id": "5", "link": "https://example.com/a"},
+        ]
+
+        result = list(dedup_items(iter(items), window=2))
+
+        # "a" has been evicted from the window by the time it reappears
+        assert [item["id"] for item in result] == ["1", "2", "3", "5"]
+
+    @patch("app.batch.dynamo_write.boto3.resource")
+    def test_dynamo_stream_write_consumes_generator(self, mock_boto3_resource):
+        """Test stream write accepts a generator and drops None values"""
+        mock_table = MagicMock()
+        mock_batch_writer = MagicMock()
+        mock_table.batch_writer.return_value.__enter__ = MagicMock(return_value=mock_batch_writer)
+        mock_table.batch_writer.return_value.__exit__ = MagicMock(return_value=False)
+        mock_boto3_resource.return_value.Table.return_value = mock_table
+        
+        items = ({"id": str(i), "title": f"Test{i}", "summary": None} for i in range(30))
+        
+        count = dynamo_stream_write(items, "test-table")
+        
+        assert count == 30
+        assert mock_batch_writer.put_item.call_count == 30
+        item = mock_batch_writer.put_item.call_args[1]["Item"]
+        assert "summary" not in item
+
+
+class TestNearDuplicate:
+    """Tests for MinHash/LSH near-duplicate clustering"""
+    
+    ARTICLES = [
+        {"link": "https://openai.com/news/a", "title": "OpenAI、新モデル「GPT-5」を発表　推論性能が大幅に向上", "summary": ""},
+        {"link": "https://rss.itmedia.co.jp/a", "title": "OpenAIが新モデル「GPT-5」を発表、推論性能が大幅に向上", "summary": ""},
+        {"link": "https://pytorch.org/blog/b", "title": "PyTorch 2.6 Release Blog: torch.compile improvements", "summary": ""},
+        {"link": "https://zenn.dev/c", "title": "PyTorch 2.6 release blog - torch.compile improvements", "summary": ""},
+        {"link": "https://aws.amazon.com/d", "title": "Amazon Bedrock でプロンプトキャッシュが利用可能に", "summary": ""},
+    ]
+    
+    def test_cluster_ids_groups_cross_posts(self):
+        """Test that Japanese and English cross-posts share a cluster ID"""
+        ids = list(near_dup.cluster_ids(self.ARTICLES))
+        
+        assert ids[0] == ids[1] == "https://openai.com/news/a"
+        assert ids[2] == ids[3] == "https://pytorch.org/blog/b"
+        assert ids[4] == "https://aws.amazon.com/d"
+    
+    def test_collapse_duplicates_keeps_first_representative(self):
+        """Test that each cluster is collapsed to its first article"""
+        result = near_dup.collapse_duplicates(self.ARTICLES)
+        
+        assert [item["link"] for item in result] == [
+            "https://openai.com/news/a", "https://pytorch.org/blog/b", "https://aws.amazon.com/d"]
+    
+    def test_empty_text_is_never_a_duplicate(self):
+        """Test that articles without text are kept separately"""
+        items = [{"link": "a", "title": ""}, {"link": "b", "title": ""}]
+        
+        assert len(near_dup.collapse_duplicates(items)) == 2
+    
+    def test_short_titles_differing_by_a_word_are_distinct(self):
+        """Test that word shingles keep short titles with a different word apart"""
+        items = [{"link": "a", "title": "Article 1"}, {"link": "b", "title": "Article 2"}]
+        
+        assert len(near_dup.collapse_duplicates(items)) == 2
+    
+    def test_unrelated_poc_articles_are_not_merged(self):
+        """Test that unrelated long English posts from the same blog stay separate"""
+        with open(os.path.join(os.path.dirname(__file__), "../PoC/news_data_0404.json"), encoding="utf-8") as f:
+            articles = json.load(f)
+        google_cloud = [item for item in articles if any(title in item["title"] for title in (
+            "The new AI literacy", "Google-managed MCP server", "Cloud CISO Perspectives", "Envoy: A future-ready"))]
+        
+        assert len(google_cloud) == 4
+        assert len(set(near_dup.cluster_ids(google_cloud))) == 4
+        assert len(near_dup.collapse_duplicates(articles)) == len(articles)
+
+
+class TestEmbedding:
+    """Tests for the local hashing embedder and top-k search"""
+    
+    ARTICLES = [
+        {"link": "a", "title": "RAGの検索精度を上げるチャンク分割の工夫", "summary": "Retrieval Augmented Generation"},
+        {"link": "b", "title": "MLOps基盤をKubernetesで構築した事例", "summary": "モデルのデプロイと監視"},
+        {"link": "c", "title": "社内文書RAGの評価方法", "summary": "RAG pipeline evaluation"},
+        {"link": "d", "title": "GPUクラスタの電力効率", "summary": "データセンター"},
+    ]
+    
+    def test_tag_embeddings_stores_float16_bytes(self):
+        """Test that embeddings are stored as compact float16 bytes"""
+        items = list(embedding.tag_embeddings(iter([dict(item) for item in self.ARTICLES])))
+        
+        vector = embedding.from_bytes(items[0]["embedding"])
+        assert len(items[0]["embedding"]) == embedding.EMBEDDING_DIM * 2
+        assert vector.dtype == np.float16
+        assert abs(float(np.linalg.norm(vector.astype(np.float32))) - 1.0) < 0.01
+        assert items[0]["embedding_model"] == embedding.HashingEmbedder.model_name
+    
+    def test_search_returns_topic_articles_in_order(self):
+        """Test that top-k cosine search selects topic articles and keeps input order"""
+        items = list(embedding.tag_embeddings(iter([dict(item) for item in self.ARTICLES])))
+        
+        result = embedding.search(items, "RAG", top_k=2)
+        
+        assert [item["link"] for item in result] == ["a", "c"]
+    
+    def test_search_embeds_items_without_vectors(self):
+        """Test that items written before embeddings existed are embedded on the fly"""
+        result = embedding.search(self.ARTICLES, "MLOps", top_k=1)
+        
+        assert [item["link"] for item in result] == ["b"]
+
+
 class TestIntegration:
     """Integration tests for batch module"""
     